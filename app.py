@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 
 import asyncio
-import json
 import logging
 import os
 import random
@@ -10,9 +9,16 @@ from itertools import cycle
 
 import websockets
 
-from trivia.chat import GameController
-from trivia.game import TriviaGame
+from trivia import codec
+from trivia.bus import get_bus
+from trivia.cluster import Authority, ClusterFanOut, Edge
+from trivia.executor import guard_event_loop
+from trivia.fanout import FanOut
+from trivia.journal import journal
 from trivia.models import db
+from trivia.notify import notifier
+from trivia.ratelimit import Inbox
+from trivia.rooms import Rooms
 
 logging.basicConfig(
     format="%(asctime)s %(levelname)-7s %(module)+7s: %(message)s", level=logging.INFO
@@ -20,26 +26,68 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-game = GameController()
+# "standalone" runs everything, or scale out to one "authority" running
+# the game and any number of "edge" processes holding the websockets.
+ROLE = os.environ.get("ROLE", "standalone")
+BUS_URL = os.environ.get("BUS_URL", "unix:///tmp/triviaroyale.sock")
+BUS_SECRET = os.environ.get("BUS_SECRET")
+
+bus, edge = None, None
+if ROLE == "standalone":
+    fanout = FanOut()
+elif ROLE == "authority":
+    bus = get_bus(BUS_URL, serve=True, secret=BUS_SECRET)
+    fanout = ClusterFanOut(bus)
+elif ROLE == "edge":
+    bus = get_bus(BUS_URL, secret=BUS_SECRET)
+    fanout = FanOut()
+    edge = Edge(bus, fanout, os.environ.get("EDGE_ID"))
+else:
+    raise ValueError("Unknown ROLE: {}".format(ROLE))
+
+rooms = Rooms(fanout)
 
 MAX_MSG_SIZE = 2 ** 10  # 1kb
 
 
 async def game_handle(ws, data):
     keys = data.keys()
+    room = rooms.of(ws)
+    if room is None:
+        return
+    game = room.game
 
     if "ping" in keys and ws.open:
         asyncio.ensure_future(send(ws, {"pong": data.get("ping")}))
 
     if "command" in keys:
-        game.command(ws, data.get("command"), data.get("args", None))
+        if data.get("command") == "join":
+            join_room(ws, data.get("args", None))
+        else:
+            game.command(ws, data.get("command"), data.get("args", None))
 
     if "text" in keys:
         game.chat(ws, data.get("text"))
 
 
+def join_room(ws, args):
+    if isinstance(args, list):
+        rooms.move(ws, *args[:1])
+    elif isinstance(args, dict):
+        rooms.move(ws, args.get("room"))
+    else:
+        rooms.move(ws, args)
+
+
 async def handler(ws, path):
-    game.join(ws)
+    fanout.register(ws, codec.negotiate(ws, path))
+    if edge is not None:
+        edge.open(ws, path)
+    elif rooms.enter(ws, path) is None:
+        fanout.unregister(ws)
+        await ws.close(1013, "Room not available")
+        return
+    inbox = Inbox(ws, edge.forward if edge is not None else game_handle, fanout.send)
     try:
         while True:
             try:
@@ -50,29 +98,33 @@ async def handler(ws, path):
                 logger.warn("Discarding message: Too long: {}".format(len(message)))
                 continue
             try:
-                data = json.loads(message)
+                data = codec.decode(message)
             except ValueError:
                 logger.warn(
                     "Discarding message: Invalid format: {}".format(message[:100])
                 )
                 continue
-            asyncio.ensure_future(game_handle(ws, data))
-
-            if "ping" not in data:
-                await asyncio.sleep(0.25)  # message throttling
+            if not isinstance(data, dict):
+                logger.warn(
+                    "Discarding message: Not an object: {}".format(message[:100])
+                )
+                continue
+            inbox.put(data)
     finally:
-        game.leave(ws)
+        inbox.close()
+        if edge is not None:
+            edge.close(ws)
+        else:
+            rooms.leave(ws)
+        fanout.unregister(ws)
 
 
-async def send(ws, message):
-    message = json.dumps(message)
-    await ws.send(message)
+async def send(ws, message, key=None):
+    fanout.send(ws, message, key)
 
 
-async def broadcast(message):
-    message = json.dumps(message)
-    for ws in game.clients:
-        await ws.send(message)
+async def broadcast(message, key=None):
+    fanout.broadcast(rooms.clients(), message, key)
 
 
 async def promote():
@@ -104,7 +156,7 @@ async def promote():
 
 if __name__ == "__main__":
     listen_ip = os.environ.get("HOST", "localhost")
-    listen_port = 8180
+    listen_port = int(os.environ.get("PORT", 8180))
 
     if "CERT_FILE" in os.environ and "CERT_KEY" in os.environ:
         secure = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
@@ -112,24 +164,38 @@ if __name__ == "__main__":
     else:
         secure = None
 
-    db.bind(
-        provider="postgres",
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASS", ""),
-        host=os.getenv("DB_HOST", "localhost"),
-        database=os.getenv("DB_NAME", "trivia"),
-    )
-    db.generate_mapping(create_tables=True)
-
-    server = websockets.serve(handler, listen_ip, listen_port, ssl=secure)
-
-    trivia = TriviaGame(broadcast, send)
-    game.trivia = trivia
-    game.send = send
-    game.broadcast = broadcast
-
     loop = asyncio.get_event_loop()
+    if bus is not None:
+        loop.run_until_complete(bus.start())
+
+    if edge is None:
+        db.bind(
+            provider="postgres",
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASS", ""),
+            host=os.getenv("DB_HOST", "localhost"),
+            database=os.getenv("DB_NAME", "trivia"),
+        )
+        db.generate_mapping(create_tables=True)
+        loop.run_until_complete(journal.replay())
+
+        if os.environ.get("DB_LOOP_DEBUG"):
+            guard_event_loop()
+
+        if bus is not None:
+            Authority(bus, rooms, game_handle)
+        rooms.get(Rooms.DEFAULT)
+        asyncio.ensure_future(promote())
+        asyncio.ensure_future(journal.run())
+        asyncio.ensure_future(notifier.run())
+
+    server = websockets.serve(
+        handler,
+        listen_ip,
+        listen_port,
+        ssl=secure,
+        subprotocols=codec.SUBPROTOCOLS,
+        **codec.deflate_settings()
+    )
     loop.run_until_complete(server)
-    loop.run_until_complete(promote())
-    loop.run_until_complete(trivia.run())
     loop.run_forever()
@@ -0,0 +1,76 @@
+"""
+Answer checking cost and verdicts on a chat corpus.
+
+Replays the messages of a corpus (answers, a tab and a chat message per
+line, see bench/chat_corpus.tsv) against the AnswerMatcher and the
+word boundary regex Question.check_answer used before, printing the
+time per message and every message the two disagree on.
+
+    python bench/answers.py [corpus]
+
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from trivia.answers import AnswerMatcher  # NOQA
+from trivia.models import Question  # NOQA
+
+CORPUS = os.path.join(os.path.dirname(__file__), "chat_corpus.tsv")
+
+
+def regex_matcher(answer):
+    answers = map(lambda a: re.escape(a), answer.split("|"))
+    pattern = r"\b{}\b".format("|".join(answers))
+    return re.compile(pattern, re.IGNORECASE).search
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip() and not line.startswith("#"):
+                answer, message = line.rstrip("\n").split("\t", 1)
+                yield answer, message
+
+
+def run(name, checks, number):
+    took = timeit.timeit(lambda: [check(text) for check, text in checks], number=number)
+    print(
+        "{:<28} {:>8.2f}us per message".format(name, took / number / len(checks) * 1e6)
+    )
+
+
+def main():
+    corpus = list(load(sys.argv[1] if len(sys.argv) > 1 else CORPUS))
+    answers = {answer for answer, _ in corpus}
+    regexes = {answer: regex_matcher(answer) for answer in answers}
+    matchers = {
+        answer: AnswerMatcher(answer.split("|"), Question.COMMON_WORDS).match
+        for answer in answers
+    }
+
+    print("{} messages, {} questions".format(len(corpus), len(answers)))
+    run("regex", [(regexes[answer], text) for answer, text in corpus], 2000)
+    run("AnswerMatcher", [(matchers[answer], text) for answer, text in corpus], 2000)
+
+    # Cost has to stay linear in the message, whatever the number of answers.
+    many = AnswerMatcher(["answer number {}".format(i) for i in range(100)]).match
+    long_text = "no idea, maybe it's something else entirely " * 4
+    run("100 answers, long message", [(many, long_text)], 2000)
+
+    print()
+    for answer, text in corpus:
+        old, new = bool(regexes[answer](text)), matchers[answer](text)
+        if old != new:
+            print(
+                "{:<8} {!r} for {!r}".format(
+                    "accepted" if new else "rejected", text, answer
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
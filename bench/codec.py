@@ -0,0 +1,102 @@
+"""
+Encode/decode cost and bytes on the wire of the websocket codecs.
+
+Measures typical game state, chat and scrollback frames with every
+available codec, raw and after per-message deflate.
+
+    python bench/codec.py
+
+"""
+import os
+import sys
+import time
+import timeit
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from trivia.codec import JsonCodec, MsgpackCodec, msgpack, orjson  # NOQA
+
+NOW = time.time()
+
+CHAT = {
+    "player": "SomePlayer",
+    "text": "Is it the Treaty of Westphalia?",
+    "seq": 1792287045361,
+    "time": int(NOW),
+}
+
+STATE = {
+    "state": {
+        "v": 1,
+        "state": "question",
+        "now": NOW,
+        "round": 123456,
+        "question": "Which treaty ended the Thirty Years' War in 1648?",
+        "categories": "History, Europe",
+        "started": NOW - 12.5,
+        "deadline": NOW + 32.5,
+        "hint": "<kbd>T______ o_ W__________</kbd>",
+        "hints": 1,
+        "hint_max": 3,
+        "hint_timing": 10.0,
+    }
+}
+
+SETINFO = {
+    "setinfo": {
+        "playercount": "24 Players",
+        "players": ["Player%d" % i for i in range(24)],
+    }
+}
+
+SCROLLBACK = [dict(CHAT, seq=CHAT["seq"] + i) for i in range(50)]
+
+FRAMES = [
+    ("state", STATE),
+    ("setinfo", SETINFO),
+    ("chat", CHAT),
+    ("scrollback", SCROLLBACK),
+]
+
+
+def deflated(frame):
+    if isinstance(frame, str):
+        frame = frame.encode()
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -12, 5)
+    return len(compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+
+
+def main():
+    codecs = [("json", JsonCodec(fast=False))]
+    if orjson is not None:
+        codecs.append(("orjson", JsonCodec()))
+    if msgpack is not None:
+        codecs.append(("msgpack", MsgpackCodec()))
+
+    print(
+        "{:<11} {:<8} {:>10} {:>10} {:>7} {:>9}".format(
+            "frame", "codec", "encode", "decode", "bytes", "deflated"
+        )
+    )
+    for frame_name, message in FRAMES:
+        for codec_name, codec in codecs:
+            frame = codec.encode(message)
+            number = 20000
+            encode = timeit.timeit(lambda: codec.encode(message), number=number)
+            decode = timeit.timeit(lambda: codec.decode(frame), number=number)
+            size = len(frame.encode() if isinstance(frame, str) else frame)
+            print(
+                "{:<11} {:<8} {:>8.2f}us {:>8.2f}us {:>7} {:>9}".format(
+                    frame_name,
+                    codec_name,
+                    encode / number * 1e6,
+                    decode / number * 1e6,
+                    size,
+                    deflated(frame),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
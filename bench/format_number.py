@@ -0,0 +1,56 @@
+"""
+Cost of the format_number template filter for a page worth of numbers.
+
+Compares the cached NumberFormat with switching the process locale and
+formatting with the locale module on every call, like the filter used to.
+
+    python bench/format_number.py
+
+"""
+import locale
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from trivia.helpers import LOCALE, format_number  # NOQA
+
+# A highscores page has points and rounds for up to 100 players, the
+# stats page four periods of six values.
+PAGE = [random.randint(0, 500000) for _ in range(200)] + [
+    random.uniform(0, 1000) for _ in range(24)
+]
+
+
+def locale_format_number(num, decimal_places=0):
+    locale.setlocale(locale.LC_ALL, LOCALE)
+    if decimal_places > 0 and isinstance(num, float):
+        return locale.format_string("%.{}f".format(decimal_places), num, grouping=True)
+    return locale.format_string("%d", num, grouping=True)
+
+
+def render(fn):
+    return [fn(num, 2 if isinstance(num, float) else 0) for num in PAGE]
+
+
+def main():
+    print("locale {}, {} numbers per page".format(LOCALE, len(PAGE)))
+    candidates = [("NumberFormat", format_number)]
+    try:
+        locale.setlocale(locale.LC_ALL, LOCALE)
+        candidates.append(("setlocale", locale_format_number))
+        if render(locale_format_number) != render(format_number):
+            print("warning: output differs from the locale module")
+    except locale.Error:
+        print("locale {} is not installed, skipping setlocale".format(LOCALE))
+
+    for name, fn in candidates:
+        number = 500
+        took = timeit.timeit(lambda: render(fn), number=number)
+        print("{:<14} {:>8.1f}us per page".format(name, took / number * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Per-message cost of the chat word filter as the word list grows.
+
+Compares the single-pass WordFilter with applying one regex per stem,
+like GameController.good_place used to.
+
+    python bench/good_place.py
+
+"""
+import json
+import os
+import random
+import re
+import string
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from trivia.goodplace import WordFilter  # NOQA
+
+SIZES = [8, 50, 100, 250, 500]
+MESSAGES = 200
+
+
+def random_word(length):
+    return "".join(random.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def word_list(size):
+    return {
+        random_word(random.randint(4, 8)): {
+            "replace": random_word(5),
+            "prefixes": [random_word(3)],
+            "suffixes": ["s", "ed", "ing"],
+        }
+        for _ in range(size)
+    }
+
+
+def regexes(config):
+    return [
+        (
+            re.compile(
+                r"\b({})?{}({})?\b".format(
+                    "|".join(options["prefixes"]), stem, "|".join(options["suffixes"])
+                ),
+                re.IGNORECASE,
+            ),
+            r"\1{}\2".format(options["replace"]),
+        )
+        for stem, options in config.items()
+    ]
+
+
+def main():
+    random.seed(1)
+    messages = [
+        " ".join(random_word(random.randint(2, 9)) for _ in range(random.randint(3, 15)))
+        for _ in range(MESSAGES)
+    ]
+
+    print("{:>6} {:>14} {:>14}".format("words", "single pass", "regex each"))
+    for size in SIZES:
+        config = word_list(size)
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump(config, f)
+        word_filter = WordFilter(f.name)
+        compiled = regexes(config)
+
+        def single():
+            for message in messages:
+                word_filter.sub(message)
+
+        def each():
+            for message in messages:
+                for r, repl in compiled:
+                    message = r.sub(repl, message)
+
+        runs = 20
+        single_us = timeit.timeit(single, number=runs) / runs / MESSAGES * 1e6
+        each_us = timeit.timeit(each, number=runs) / runs / MESSAGES * 1e6
+        print("{:>6} {:>12.2f}us {:>12.2f}us".format(size, single_us, each_us))
+        os.unlink(f.name)
+
+
+if __name__ == "__main__":
+    main()
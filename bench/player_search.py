@@ -0,0 +1,78 @@
+"""
+Player name autocomplete and search against a large player table.
+
+Adds bench players (once) up to the given count, creates the search
+indexes and times Player.complete and Player.search for a few inputs.
+The autocomplete plan has to use the prefix index. Needs a PostgreSQL
+database of its own with the pg_trgm extension available, BENCH_DB_NAME
+(trivia_bench by default), never the one app.py uses: the bench players
+would fill its search results.
+
+    python bench/player_search.py [players]
+
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pony.orm import db_session  # NOQA
+
+from trivia.models import Player, db  # NOQA
+
+SEED_SQL = """
+    INSERT INTO player (name, password_hash, email, permissions)
+    SELECT 'bench' || md5(i::text)::varchar(20), '', '', 0
+    FROM generate_series(1, $players) AS i
+    ON CONFLICT DO NOTHING
+""".strip()
+
+INPUTS = ["b", "bench", "bench0a", "bench0a1b", "zzz"]
+
+
+def main():
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    database = os.getenv("BENCH_DB_NAME", "trivia_bench")
+    if database == os.getenv("DB_NAME", "trivia"):
+        sys.exit("BENCH_DB_NAME must not be the database app.py uses")
+    db.bind(
+        provider="postgres",
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS", ""),
+        host=os.getenv("DB_HOST", "localhost"),
+        database=database,
+    )
+    db.generate_mapping(create_tables=True)
+
+    with db_session:
+        if Player.select().count() < players:
+            db.execute(SEED_SQL, {}, {"players": players})
+        Player.create_search_indexes()
+        db.execute("ANALYZE player")
+
+    with db_session:
+        plan = "\n".join(
+            row
+            for row in db.select(
+                "EXPLAIN " + Player.COMPLETE_SQL,
+                {},
+                {"pattern": "bench0a%", "limit": 10},
+            )
+        )
+        assert "idx_player__name_prefix" in plan, plan
+
+        print("{:<10} {:>12} {:>12}".format("input", "complete", "search"))
+        for text in INPUTS:
+            number = 200
+            complete = timeit.timeit(lambda: Player.complete(text), number=number)
+            search = timeit.timeit(lambda: Player.search(text), number=number)
+            print(
+                "{:<10} {:>10.3f}ms {:>10.3f}ms".format(
+                    text, complete / number * 1e3, search / number * 1e3
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Queries and plans behind the player stats page.
+
+Seeds a bench player with many rounds (once), then checks that
+Player.get_stats and Player.get_recent_rounds take a single query each
+and that their plans use the (solver, start_time) index instead of
+scanning the round table. Needs a PostgreSQL database of its own,
+BENCH_DB_NAME (trivia_bench by default), never the one app.py uses: the
+seeded rounds would top its highscores.
+
+    python bench/player_stats.py [rounds]
+
+"""
+import logging
+import os
+import sys
+import timeit
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pony.orm import db_session, set_sql_debug  # NOQA
+
+from trivia.models import Player, Question, db  # NOQA
+
+PLAYER = "bench-player-stats"
+
+
+class QueryCounter(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+SEED_SQL = """
+    INSERT INTO round (question, start_time, solved, solver, time_taken, points)
+    SELECT
+        $question,
+        now() at time zone 'utc' - random() * interval '730 days',
+        true,
+        CASE WHEN mod(i, 20) = 0 THEN $player ELSE $other END,
+        1 + random() * 45,
+        10 + floor(random() * 290)
+    FROM generate_series(1, $rounds) AS i
+""".strip()
+
+
+def seed(rounds):
+    """
+    Add the bench player with every 20th of ``rounds`` rounds, spread over two
+    years, the others go to some other player so the table isn't all ours.
+
+    """
+    player = Player.get(name=PLAYER)
+    if player is not None:
+        return player
+    player = Player(name=PLAYER)
+    other = Player.get(name=PLAYER + "-other") or Player(name=PLAYER + "-other")
+    db.flush()
+    question = Question.select().first() or Question(question="Bench?", answer="bench")
+    db.flush()
+    db.execute(
+        SEED_SQL,
+        {},
+        {
+            "question": question.id,
+            "player": player.id,
+            "other": other.id,
+            "rounds": rounds,
+        },
+    )
+    db.execute("ANALYZE round")
+    return player
+
+
+def explain(sql, params):
+    plan = "\n".join(row for row in db.select("EXPLAIN " + sql, {}, params))
+    assert "Seq Scan on round" not in plan, plan
+    return plan
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    database = os.getenv("BENCH_DB_NAME", "trivia_bench")
+    if database == os.getenv("DB_NAME", "trivia"):
+        sys.exit("BENCH_DB_NAME must not be the database app.py uses")
+    db.bind(
+        provider="postgres",
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASS", ""),
+        host=os.getenv("DB_HOST", "localhost"),
+        database=database,
+    )
+    db.generate_mapping(create_tables=True)
+
+    with db_session:
+        player = seed(rounds)
+        day = date.today()
+
+        counter = QueryCounter()
+        sql_logger = logging.getLogger("pony.orm.sql")
+        sql_logger.setLevel(logging.INFO)
+        sql_logger.addHandler(counter)
+        set_sql_debug(True)
+        for name, run in [
+            ("get_stats", lambda: player.get_stats(day)),
+            ("get_recent_rounds", player.get_recent_rounds),
+        ]:
+            counter.count = 0
+            run()
+            queries = counter.count
+            set_sql_debug(False)
+            number = 100
+            took = timeit.timeit(run, number=number)
+            set_sql_debug(True)
+            print(
+                "{:<18} {} query {:>8.2f}ms".format(name, queries, took / number * 1e3)
+            )
+            assert queries == 1, queries
+        set_sql_debug(False)
+
+        now = datetime.utcnow()
+        midnight = datetime(day.year, day.month, day.day)
+        print(explain(Player.STATS_SQL, player.get_stats_params(day)))
+        print(
+            explain(
+                Player.RECENT_ROUNDS_SQL,
+                {"player": player.id, "start": min(now - timedelta(hours=1), midnight)},
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
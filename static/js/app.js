@@ -3,13 +3,36 @@
 
   var TIMER_COLOR_START = [76, 175, 80, 0.5], // #4caf50
     TIMER_COLOR_END = [244, 67, 54, 0.5], // #f44336
-    PING_FREQ = 10000;
-
-  var ws = new ReconnectingWebSocket(WS_ADDR, null, {
-      automaticOpen: false,
-      maxReconnectAttempts: 10,
-    }),
+    PING_FREQ = 10000,
+    PROTOCOL_VERSION = 1,
+    IDLE_HTML =
+      "<p>TriviaRoyale is not running.</p>" +
+      '<p><button class="z1" onclick="command(\'start\')">Start new round</button></p>' +
+      "<p>Coming soon: <strong>TriviaRoyale 2.0!</strong></p>" +
+      '<p class="social-flex"><a target="_blank" href="https://twitter.com/triviaroyaleio" class="button tiny social">' +
+      '<svg width="16" height="16" fill="currentColor" class="btn-icon" viewBox="0 0 24 24"><path d="M24 4.6a10 10 0 0 1-2.9.7 5 5 0 0 0 2.2-2.7c-1 .6-2 1-3.1 1.2a5 5 0 0 0-8.4 4.5A14 14 0 0 1 1.6 3.2 4.8 4.8 0 0 0 1 5.6a5 5 0 0 0 2.2 4.1 4.9 4.9 0 0 1-2.3-.6A5 5 0 0 0 5 14a5 5 0 0 1-2.2 0 5 5 0 0 0 4.6 3.5 9.9 9.9 0 0 1-6.1 2.1H0a14 14 0 0 0 7.6 2.2c9 0 14-7.5 14-14V7A10 10 0 0 0 24 4.6z"/></svg>' +
+      'Follow on Twitter</a><a target="_blank" href="https://beta.triviaroyale.io/blog/subscribe/" class="button tiny social">' +
+      '<svg width="16" height="16" class="btn-icon" viewBox="0 0 20 20" fill="currentColor"><path d="M2.003 5.884L10 9.882l7.997-3.998A2 2 0 0016 4H4a2 2 0 00-1.997 1.884z" /><path d="M18 8.118l-8 4-8-4V14a2 2 0 002 2h12a2 2 0 002-2V8.118z" /></svg>' +
+      "Subscribe to newsletter</a></p>";
+
+  var ws = new ReconnectingWebSocket(
+      WS_ADDR,
+      window.msgpack ? ["msgpack", "json"] : ["json"],
+      {
+        automaticOpen: false,
+        maxReconnectAttempts: 10,
+        binaryType: "arraybuffer",
+      }
+    ),
     playerList = [],
+    resumeToken = null,
+    lastSeq = null,
+    busyCommands = {},
+    busyAttempts = 0,
+    busyTimeout,
+    gameState = null,
+    clockOffset = 0,
+    hintTimeout,
     pingTimeout,
     modalTimeout,
     timerTimeout;
@@ -29,7 +52,6 @@
   })();
 
   ws.addEventListener("open", function (event) {
-    var playername, password;
     pagestatus.innerHTML = "<p>Connected! :)</p>";
 
     setTimeout(function () {
@@ -37,6 +59,15 @@
       ws.send(JSON.stringify({ ping: performance.now() }));
     }, 500);
 
+    if (resumeToken) {
+      command("resume", { token: resumeToken, since: lastSeq });
+    } else {
+      autoLogin();
+    }
+  });
+
+  function autoLogin() {
+    var playername, password;
     playername = localStorage.getItem("playername");
     if (playername) {
       password = localStorage.getItem("password");
@@ -56,7 +87,7 @@
       sidebarnag.classList.remove("hidden");
       _paq.push(["trackEvent", "Game", "Login", "NewPlayer"]);
     }
-  });
+  }
   ws.addEventListener("connecting", function (event) {
     pagestatus.innerHTML = "<p>Connecting...</p>";
   });
@@ -68,7 +99,10 @@
     _paq.push(["trackEvent", "Connection", "Disconnected"]);
   });
   ws.addEventListener("message", function (message) {
-    var data = JSON.parse(message.data);
+    var data =
+      typeof message.data === "string"
+        ? JSON.parse(message.data)
+        : window.msgpack.decode(message.data);
     if (data instanceof Array) {
       data.forEach(handleMessage);
     } else {
@@ -80,6 +114,22 @@
     if (data.pong) {
       checkLatency(data.pong);
     }
+    if (data.seq) {
+      lastSeq = data.seq;
+    }
+    if (data.busy) {
+      retryBusy(data.busy.command, data.busy.retry);
+    }
+    if ("resume" in data) {
+      resumeToken = data.resume;
+      if (resumeToken) {
+        // logged in
+        busyAttempts = 0;
+      }
+      if (!resumeToken) {
+        autoLogin();
+      }
+    }
     if (data.player && data.text) {
       chatMessage({
         player: data.player,
@@ -98,6 +148,15 @@
     if (data.prompt) {
       window.showModal(data.prompt, data.data);
     }
+    if (data.state) {
+      updateState(data.state);
+    }
+    if (data.state_delta) {
+      updateStateDelta(data.state_delta);
+    }
+    if (data.players_delta) {
+      updatePlayersDelta(data.players_delta);
+    }
     if (data.setinfo) {
       for (var key in data.setinfo) {
         if (key === "players") {
@@ -123,9 +182,6 @@
           chatinput.focus();
           _paq.push(["trackEvent", "Game", "Login", "LoginSuccessful"]);
         }
-        if (key === "timer") {
-          animateTimer();
-        }
       }
     }
     if (data.log_event) {
@@ -151,19 +207,180 @@
     }, PING_FREQ);
   }
 
+  function serverTime() {
+    return Date.now() / 1000 + clockOffset;
+  }
+
+  function updateState(state) {
+    if (state.v !== PROTOCOL_VERSION) {
+      console.warn("Unknown game state version:", state.v);
+    }
+    clockOffset = state.now - Date.now() / 1000;
+    gameState = state;
+    renderGame();
+    renderTimer();
+  }
+
+  function updateStateDelta(delta) {
+    // hints of a previous round may still arrive after its end
+    if (
+      !gameState ||
+      gameState.state !== "question" ||
+      gameState.round !== delta.round
+    ) {
+      return;
+    }
+    gameState.hint = delta.hint;
+    gameState.hints = delta.hints;
+    renderGame();
+  }
+
+  function renderGame() {
+    var state = gameState,
+      html,
+      hintAt;
+
+    clearTimeout(hintTimeout);
+    switch (state.state) {
+      case "question":
+        html =
+          '<p class="question-info">#' +
+          state.round +
+          "</p>" +
+          '<p class="question-categories">' +
+          state.categories +
+          "</p>" +
+          '<p class="question">' +
+          state.question +
+          "</p>";
+        if (state.hint) {
+          html += '<p class="question-hint">' + state.hint + "</p>";
+        }
+        if (state.hints < state.hint_max) {
+          hintAt = state.started + state.hints * state.hint_timing;
+          if (serverTime() >= hintAt) {
+            html +=
+              '<p><button class="tiny z2" onclick="command(\'hint\')">Get hint</button></p>';
+          } else {
+            hintTimeout = setTimeout(renderGame, (hintAt - serverTime()) * 1000);
+          }
+        }
+        break;
+      case "waiting":
+        html = '<p class="question-info">#' + state.round + "</p>";
+        if (state.result) {
+          html +=
+            "<p><b>" +
+            escapeHTML(state.result.solver) +
+            "</b> got <b>" +
+            state.result.points +
+            "</b> points for answering in <b>" +
+            state.result.time_taken.toFixed(2) +
+            "s</b>: <br>" +
+            state.question +
+            "</p><p>Correct answer: <b>" +
+            state.answer +
+            "</b></p>";
+        } else {
+          html +=
+            "<p>" +
+            state.question +
+            "</p><p><b>Time's up!</b> Nobody got the answer: <b>" +
+            state.answer +
+            "</b></p>";
+        }
+        html +=
+          '<p id="question-vote" class="question-vote">' +
+          '<button class="tiny positive z2" onclick="command(\'vote\', 1)">Good Question</button>' +
+          '<button class="tiny negative z2" onclick="command(\'vote\', -1)">Bad Question</button></p>';
+        break;
+      case "starting":
+        html = "<p>New round starting in a few seconds...</p>";
+        break;
+      case "locked":
+        html =
+          "<p>TriviaRoyale is stopped.</p><p>Only an administrator can start it.</p>";
+        break;
+      default:
+        html = IDLE_HTML;
+    }
+    document.getElementById("game").innerHTML = html;
+  }
+
+  function renderTimer() {
+    var state = gameState,
+      labels = {
+        question: "",
+        waiting: "Next round in: ",
+        starting: "Starting in: ",
+      },
+      total,
+      timeLeft;
+
+    clearTimeout(timerTimeout);
+    if (!state.deadline) {
+      document.getElementById("timer").innerHTML = "";
+      return;
+    }
+    total = state.deadline - state.started;
+    timeLeft = Math.max(0, state.deadline - serverTime());
+    document.getElementById("timer").innerHTML =
+      '<div class="timer-bar' +
+      (state.state === "question" ? "" : " colorless") +
+      '" style="width:' +
+      (timeLeft / total) * 100 +
+      '%" data-total-time="' +
+      total +
+      '" data-time-left="' +
+      timeLeft +
+      '"></div><div class="timer-value">' +
+      labels[state.state] +
+      "<span>" +
+      timeLeft.toFixed(0) +
+      "</span>s</div>";
+    animateTimer();
+  }
+
+  /**
+   * players are [key, name] pairs in join order
+   */
   function updatePlayers(players) {
+    playerList = players;
+    renderPlayers();
+  }
+
+  // deltas are idempotent, they may overlap with a full list sent before
+  function updatePlayersDelta(delta) {
+    var i, j;
+    for (i = 0; i < delta.add.length; i += 1) {
+      for (j = 0; j < playerList.length; j += 1) {
+        if (playerList[j][0] === delta.add[i][0]) {
+          playerList[j] = delta.add[i];
+          break;
+        }
+      }
+      if (j === playerList.length) {
+        playerList.push(delta.add[i]);
+      }
+    }
+    playerList = playerList.filter(function (player) {
+      return delta.remove.indexOf(player[0]) === -1;
+    });
+    renderPlayers();
+  }
+
+  function renderPlayers() {
     var html = "",
       i;
-    for (i = 0; i < players.length; i += 1) {
+    for (i = 0; i < playerList.length; i += 1) {
       html +=
         "<li><a onclick=\"showModal('ajax', '/stats/user/?name=" +
-        encodeURIComponent(players[i]) +
+        encodeURIComponent(playerList[i][1]) +
         "')\">" +
-        escapeHTML(players[i]) +
+        escapeHTML(playerList[i][1]) +
         "</a></li>";
     }
     playerlist.innerHTML = html;
-    playerList = players;
   }
 
   window.randomnick = function () {
@@ -345,7 +562,28 @@
     }
   }
 
+  /**
+   * The server was too busy for a command, send it again after a random
+   * part of an exponentially growing delay, so reconnecting clients spread.
+   */
+  function retryBusy(cmd, retry) {
+    var delay;
+    if (!(cmd in busyCommands)) {
+      return;
+    }
+    delay = Math.min(retry * Math.pow(2, busyAttempts), 60) * 1000;
+    busyAttempts += 1;
+    clearTimeout(busyTimeout);
+    busyTimeout = setTimeout(function () {
+      command(cmd, busyCommands[cmd]);
+    }, delay / 2 + Math.random() * delay);
+  }
+
   function command(cmd, args) {
+    if (cmd === "login") {
+      busyCommands[cmd] = args;
+      clearTimeout(busyTimeout);
+    }
     ws.send(
       JSON.stringify({
         command: cmd,
@@ -566,6 +804,48 @@
     };
   }
 
+  /**
+   * Fill the datalist of inputs with a data-autocomplete url as the user types.
+   */
+  function autocomplete() {
+    var timer = null,
+      latest = null;
+
+    return function (event) {
+      var input = event.target,
+        url = input.dataset && input.dataset.autocomplete,
+        value = input.value;
+
+      if (!url || !input.list) {
+        return;
+      }
+      clearTimeout(timer);
+      if (!value) {
+        input.list.innerHTML = "";
+        return;
+      }
+      timer = setTimeout(function () {
+        latest = value;
+        ajax(
+          url + "?q=" + encodeURIComponent(value),
+          null,
+          function (res) {
+            if (value !== latest) {
+              return;
+            }
+            input.list.innerHTML = "";
+            JSON.parse(res).names.forEach(function (name) {
+              var option = document.createElement("option");
+              option.value = name;
+              input.list.appendChild(option);
+            });
+          },
+          function () {}
+        );
+      }, 150);
+    };
+  }
+
   document.addEventListener("DOMContentLoaded", function () {
     form.addEventListener("submit", function (event) {
       event.preventDefault();
@@ -628,6 +908,8 @@
       }
     });
 
+    modal.addEventListener("input", autocomplete());
+
     modalform.addEventListener("submit", function (event) {
       var el,
         args = {};
@@ -0,0 +1,164 @@
+(function (window) {
+  "use strict";
+
+  /**
+   * Minimal MessagePack decoder for game messages, see trivia/codec.py.
+   */
+  var utf8 = new TextDecoder("utf-8");
+
+  function decode(buffer) {
+    var view = new DataView(buffer),
+      bytes = new Uint8Array(buffer),
+      pos = 0;
+
+    function str(length) {
+      var value = utf8.decode(bytes.subarray(pos, pos + length));
+      pos += length;
+      return value;
+    }
+
+    function bin(length) {
+      var value = buffer.slice(pos, pos + length);
+      pos += length;
+      return value;
+    }
+
+    function array(length) {
+      var value = new Array(length),
+        i;
+      for (i = 0; i < length; i += 1) {
+        value[i] = read();
+      }
+      return value;
+    }
+
+    function map(length) {
+      var value = {},
+        i,
+        key;
+      for (i = 0; i < length; i += 1) {
+        key = read();
+        value[key] = read();
+      }
+      return value;
+    }
+
+    function uint(size) {
+      var value;
+      switch (size) {
+        case 1:
+          value = view.getUint8(pos);
+          break;
+        case 2:
+          value = view.getUint16(pos);
+          break;
+        case 4:
+          value = view.getUint32(pos);
+          break;
+        default:
+          value = view.getUint32(pos) * 4294967296 + view.getUint32(pos + 4);
+      }
+      pos += size;
+      return value;
+    }
+
+    function int(size) {
+      var value;
+      switch (size) {
+        case 1:
+          value = view.getInt8(pos);
+          break;
+        case 2:
+          value = view.getInt16(pos);
+          break;
+        case 4:
+          value = view.getInt32(pos);
+          break;
+        default:
+          value = view.getInt32(pos) * 4294967296 + view.getUint32(pos + 4);
+      }
+      pos += size;
+      return value;
+    }
+
+    function read() {
+      var type = bytes[pos],
+        value;
+      pos += 1;
+
+      if (type < 0x80) {
+        return type;
+      }
+      if (type < 0x90) {
+        return map(type & 0x0f);
+      }
+      if (type < 0xa0) {
+        return array(type & 0x0f);
+      }
+      if (type < 0xc0) {
+        return str(type & 0x1f);
+      }
+      if (type >= 0xe0) {
+        return type - 0x100;
+      }
+
+      switch (type) {
+        case 0xc0:
+          return null;
+        case 0xc2:
+          return false;
+        case 0xc3:
+          return true;
+        case 0xc4:
+          return bin(uint(1));
+        case 0xc5:
+          return bin(uint(2));
+        case 0xc6:
+          return bin(uint(4));
+        case 0xca:
+          value = view.getFloat32(pos);
+          pos += 4;
+          return value;
+        case 0xcb:
+          value = view.getFloat64(pos);
+          pos += 8;
+          return value;
+        case 0xcc:
+          return uint(1);
+        case 0xcd:
+          return uint(2);
+        case 0xce:
+          return uint(4);
+        case 0xcf:
+          return uint(8);
+        case 0xd0:
+          return int(1);
+        case 0xd1:
+          return int(2);
+        case 0xd2:
+          return int(4);
+        case 0xd3:
+          return int(8);
+        case 0xd9:
+          return str(uint(1));
+        case 0xda:
+          return str(uint(2));
+        case 0xdb:
+          return str(uint(4));
+        case 0xdc:
+          return array(uint(2));
+        case 0xdd:
+          return array(uint(4));
+        case 0xde:
+          return map(uint(2));
+        case 0xdf:
+          return map(uint(4));
+      }
+      throw new Error("msgpack: unsupported type 0x" + type.toString(16));
+    }
+
+    return read();
+  }
+
+  window.msgpack = { decode: decode };
+})(window);
@@ -1,4 +1,4 @@
-const cacheVersion = "v2.11";
+const cacheVersion = "v2.14";
 
 self.addEventListener("install", function (e) {
   e.waitUntil(
@@ -6,6 +6,7 @@ self.addEventListener("install", function (e) {
       return cache.addAll([
         "/static/css/style.css?" + cacheVersion,
         "/static/css/vendor.css?" + cacheVersion,
+        "/static/js/msgpack.js?" + cacheVersion,
         "/static/js/app.js?" + cacheVersion,
         "/static/reconnecting-websocket.min.js",
         "/static/img/icon.svg",
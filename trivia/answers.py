@@ -0,0 +1,124 @@
+import re
+import unicodedata
+
+WORD_RE = re.compile(r"\w+")
+# dropped within words, so "U.S.A." is "usa" and "O'Neill" is "oneill"
+JOINER_RE = re.compile(r"['’ʼ`´.]")
+
+
+def normalize(text, ignore_words=(), min_length=0):
+    """
+    Reduce text to lowercase words without accents and punctuation.
+
+    Words in ``ignore_words`` are left out, unless the rest would be
+    shorter than ``min_length``.
+
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    words = WORD_RE.findall(JOINER_RE.sub("", text.casefold()))
+    significant = " ".join(word for word in words if word not in ignore_words)
+    if len(significant) < max(min_length, 1):
+        return " ".join(words)
+    return significant
+
+
+class AnswerMatcher(object):
+    """
+    Finds any of a question's answers in a chat message, forgiving typos.
+
+    Message and answers are compared normalized, see ``normalize``. An
+    answer has to start and end on word boundaries of the message, with
+    its first and last character as given. In between, up to one edit
+    (insertion, deletion or substitution) per ``ERROR_RATIO`` characters
+    is allowed, at most ``MAX_ERRORS``. Answers with digits have to
+    match exactly. Articles are only left out of answers that are at
+    least ``MIN_LENGTH`` characters long without them, "The Who" has to
+    be given in full.
+
+    All answers are packed side by side into one bit vector and run
+    through the bit-parallel algorithm of Wu and Manber at once, so a
+    message is checked in a single pass no matter how many answers
+    there are.
+
+    """
+
+    ERROR_RATIO = 6
+    MAX_ERRORS = 2
+    MIN_LENGTH = 4
+
+    __slots__ = ("ignore_words", "masks", "starts", "inner", "finals")
+
+    def __init__(self, answers, ignore_words=()):
+        answers = [normalize(answer, ignore_words, self.MIN_LENGTH) for answer in answers]
+        answers = [answer for answer in answers if answer]
+        # kept in messages if an answer is made of them, like "The Who"
+        self.ignore_words = frozenset(ignore_words).difference(
+            word for answer in answers for word in answer.split()
+        )
+        self.masks = {}
+        self.starts = 0
+        finals = {}
+
+        offset = 0
+        for answer in answers:
+            errors = self.errors(answer)
+            for i, char in enumerate(answer):
+                self.masks[char] = self.masks.get(char, 0) | 1 << (offset + i)
+            self.starts |= 1 << offset
+            final = 1 << (offset + len(answer) - 1)
+            finals[errors] = finals.get(errors, 0) | final
+            offset += len(answer)
+
+        # shifts must not carry into the first character of the next answer
+        self.inner = ((1 << offset) - 1) & ~self.starts
+        self.finals = [
+            finals.get(errors, 0) for errors in range(max(finals, default=-1) + 1)
+        ]
+
+    @classmethod
+    def errors(cls, answer):
+        if any(char.isdigit() for char in answer):
+            return 0
+        return min(len(answer) // cls.ERROR_RATIO, cls.MAX_ERRORS)
+
+    def _found(self, matched):
+        for errors, final in enumerate(self.finals):
+            if matched[errors] & final:
+                return True
+        return False
+
+    def match(self, text):
+        if not self.finals:
+            return False
+        text = normalize(text, self.ignore_words)
+        masks, starts, inner = self.masks, self.starts, self.inner
+        state = [0] * len(self.finals)
+        # bits set by matching the character itself, answers can only end so
+        matched = [0] * len(self.finals)
+        start = starts
+
+        for char in text:
+            if char == " " and self._found(matched):
+                return True
+
+            mask = masks.get(char, 0)
+            previous = state[0]
+            state[0] = matched[0] = ((previous << 1) & inner | start) & mask
+            for errors in range(1, len(state)):
+                current = state[errors]
+                matched[errors] = ((current << 1) & inner | start) & mask
+                state[errors] = (
+                    matched[errors]
+                    # character inserted
+                    | previous
+                    # character substituted
+                    | (previous << 1) & inner
+                    # character deleted
+                    | (state[errors - 1] << 1) & inner
+                )
+                previous = current
+            # answers only start at the beginning of a word
+            start = starts if char == " " else 0
+
+        return self._found(matched)
@@ -0,0 +1,323 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+from collections import defaultdict, deque
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class Bus(object):
+    """
+    Minimal publish/subscribe message bus.
+
+    Messages are JSON serializable objects published to named channels.
+
+    """
+
+    def __init__(self):
+        self.handlers = defaultdict(list)
+        self.peer_lost_handlers = []
+
+    async def start(self):
+        pass
+
+    def subscribe(self, channel, handler):
+        self.handlers[channel].append(handler)
+
+    def on_peer_lost(self, handler):
+        """
+        Register a handler called with the channels of a disconnected peer.
+
+        """
+        self.peer_lost_handlers.append(handler)
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def deliver(self, channel, message):
+        for handler in self.handlers.get(channel, ()):
+            try:
+                handler(message)
+            except Exception:
+                logger.exception("Bus handler failed on {}".format(channel))
+
+
+class LocalBus(Bus):
+    """
+    In-process bus, for running authority and edges in one process.
+
+    """
+
+    def publish(self, channel, message):
+        asyncio.get_event_loop().call_soon(self.deliver, channel, message)
+
+
+class Peer(object):
+    """
+    Outbound frames of one bus connection.
+
+    Frames are queued without waiting on the socket and written by their
+    own task, which waits for the socket to drain. A peer that falls too
+    far behind or stops reading is disconnected.
+
+    """
+
+    MAX_PENDING = 10000
+    DRAIN_TIMEOUT = 10.0
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.frames = deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.task = asyncio.ensure_future(self.run())
+
+    def push(self, data):
+        if self.closed:
+            return False
+        if len(self.frames) >= self.MAX_PENDING:
+            logger.warn(
+                "Bus: disconnecting slow peer, {} frames pending".format(
+                    len(self.frames)
+                )
+            )
+            self.close()
+            return False
+        self.frames.append(data)
+        self.ready.set()
+        return True
+
+    async def run(self):
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.frames:
+                    self.writer.write(self.frames.popleft())
+                    await asyncio.wait_for(self.writer.drain(), self.DRAIN_TIMEOUT)
+        except ConnectionError as e:
+            logger.warn("Bus: write failed: {}".format(e))
+            self.close()
+        except asyncio.TimeoutError:
+            logger.warn("Bus: disconnecting stalled peer")
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.frames.clear()
+        self.writer.close()
+        if not self.task.done() and self.task is not asyncio.current_task():
+            self.task.cancel()
+
+
+class StreamBus(Bus):
+    """
+    Bus over a Unix or TCP socket stream.
+
+    The authority runs the broker (``serve=True``), edges connect to it.
+    Frames are newline delimited JSON objects:
+
+        {"op": "sub", "channel": "..."}
+        {"op": "pub", "channel": "...", "data": ...}
+
+    With a ``secret``, the broker starts every connection with
+    ``{"op": "hello", "nonce": "..."}`` and drops peers that don't answer
+    with ``{"op": "auth", "mac": "..."}``, the HMAC-SHA256 of the nonce,
+    after telling them ``{"op": "denied"}``.
+
+    """
+
+    RECONNECT_DELAY = 1.0
+    RECONNECT_DELAY_MAX = 30.0
+    MAX_LINE = 2 ** 24  # 16mb
+    AUTH_TIMEOUT = 5.0
+
+    def __init__(self, address, serve=False, secret=None):
+        super().__init__()
+        self.address = address
+        self.serve = serve
+        self.secret = secret.encode() if secret else None
+        self.peers = {}
+        self.peer = None
+
+    async def start(self):
+        if self.serve:
+            await self._start_server(self._peer)
+            logger.info("Bus: broker listening on {}".format(self._describe()))
+        else:
+            await self._connect()
+
+    def _describe(self):
+        if isinstance(self.address, str):
+            return self.address
+        return "{}:{}".format(*self.address)
+
+    async def _start_server(self, callback):
+        if isinstance(self.address, str):
+            return await asyncio.start_unix_server(
+                callback, self.address, limit=self.MAX_LINE
+            )
+        return await asyncio.start_server(callback, *self.address, limit=self.MAX_LINE)
+
+    async def _open_connection(self):
+        if isinstance(self.address, str):
+            return await asyncio.open_unix_connection(
+                self.address, limit=self.MAX_LINE
+            )
+        return await asyncio.open_connection(*self.address, limit=self.MAX_LINE)
+
+    @staticmethod
+    def _encode(frame):
+        return json.dumps(frame).encode() + b"\n"
+
+    def _mac(self, nonce):
+        return hmac.new(self.secret, nonce.encode(), hashlib.sha256).hexdigest()
+
+    def subscribe(self, channel, handler):
+        super().subscribe(channel, handler)
+        if not self.serve and self.peer is not None:
+            self.peer.push(self._encode({"op": "sub", "channel": channel}))
+
+    def publish(self, channel, message):
+        if self.serve:
+            self._route(channel, message)
+        elif self.peer is not None:
+            frame = {"op": "pub", "channel": channel, "data": message}
+            self.peer.push(self._encode(frame))
+        else:
+            logger.warn("Bus: not connected, dropping message to {}".format(channel))
+
+    def _route(self, channel, message, source=None):
+        asyncio.get_event_loop().call_soon(self.deliver, channel, message)
+        data = None
+        for peer, channels in self.peers.items():
+            if peer is not source and channel in channels:
+                if data is None:
+                    data = self._encode({"op": "pub", "channel": channel, "data": message})
+                peer.push(data)
+
+    async def _authenticate(self, reader, writer):
+        if self.secret is None:
+            return True
+        nonce = os.urandom(16).hex()
+        writer.write(self._encode({"op": "hello", "nonce": nonce}))
+        try:
+            line = await asyncio.wait_for(reader.readline(), self.AUTH_TIMEOUT)
+            frame = json.loads(line)
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            return False
+        if not isinstance(frame, dict) or frame.get("op") != "auth":
+            return False
+        mac = frame.get("mac")
+        return isinstance(mac, str) and hmac.compare_digest(mac, self._mac(nonce))
+
+    async def _peer(self, reader, writer):
+        if not await self._authenticate(reader, writer):
+            logger.warn("Bus: rejecting unauthenticated peer")
+            writer.write(self._encode({"op": "denied"}))
+            writer.close()
+            return
+
+        peer = Peer(writer)
+        channels = self.peers[peer] = set()
+        try:
+            async for frame in self._read(reader):
+                if frame.get("op") == "sub":
+                    channels.add(frame["channel"])
+                elif frame.get("op") == "pub":
+                    self._route(frame["channel"], frame.get("data"), source=peer)
+        finally:
+            del self.peers[peer]
+            peer.close()
+            for handler in self.peer_lost_handlers:
+                handler(channels)
+
+    async def _read(self, reader):
+        while True:
+            try:
+                line = await reader.readline()
+            except (ConnectionError, ValueError) as e:
+                logger.warn("Bus: dropping connection: {}".format(e))
+                return
+            if not line:
+                return
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logger.warn("Bus: invalid frame: {}".format(line[:100]))
+
+    async def _login(self, reader, writer):
+        if self.secret is None:
+            return
+        line = await asyncio.wait_for(reader.readline(), self.AUTH_TIMEOUT)
+        hello = json.loads(line)
+        writer.write(self._encode({"op": "auth", "mac": self._mac(hello["nonce"])}))
+
+    async def _connect(self):
+        delay = self.RECONNECT_DELAY
+        while True:
+            try:
+                reader, writer = await self._open_connection()
+                await self._login(reader, writer)
+            except (OSError, asyncio.TimeoutError, ValueError, KeyError) as e:
+                logger.warn(
+                    "Bus: cannot reach {}: {}, retry in {:.0f}s".format(
+                        self._describe(), e, delay
+                    )
+                )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.RECONNECT_DELAY_MAX)
+                continue
+            break
+
+        logger.info("Bus: connected to {}".format(self._describe()))
+        self.peer = Peer(writer)
+        for channel in self.handlers.keys():
+            self.peer.push(self._encode({"op": "sub", "channel": channel}))
+        asyncio.ensure_future(self._listen(reader))
+
+    async def _listen(self, reader):
+        delay = self.RECONNECT_DELAY
+        async for frame in self._read(reader):
+            if frame.get("op") == "pub":
+                self.deliver(frame["channel"], frame.get("data"))
+            elif frame.get("op") == "denied":
+                logger.error("Bus: {} rejected BUS_SECRET".format(self._describe()))
+                delay = self.RECONNECT_DELAY_MAX
+
+        logger.warn("Bus: lost connection to {}".format(self._describe()))
+        self.peer.close()
+        self.peer = None
+        for handler in self.peer_lost_handlers:
+            handler(set(self.handlers.keys()))
+        await asyncio.sleep(delay)
+        await self._connect()
+
+
+LOOPBACK = ("localhost", "127.0.0.1", "::1")
+
+
+def get_bus(url, serve=False, secret=None):
+    """
+    Create a bus from an URL.
+
+    Supported are ``local://``, ``unix:///path/to/socket`` and ``tcp://host:port``.
+    TCP buses on other than loopback addresses need a shared ``secret``.
+
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == "local":
+        return LocalBus()
+    if parsed.scheme == "unix":
+        return StreamBus(parsed.path, serve=serve, secret=secret)
+    if parsed.scheme == "tcp":
+        if not secret and parsed.hostname not in LOOPBACK:
+            raise ValueError("A tcp:// bus beyond loopback needs BUS_SECRET")
+        return StreamBus((parsed.hostname, parsed.port), serve=serve, secret=secret)
+    raise ValueError("Unsupported bus: {}".format(url))
@@ -1,59 +1,25 @@
 import asyncio
+import itertools
 import logging
 import os
-import re
 import time
+from datetime import datetime
 
-import requests
-
+from trivia.executor import PasswordsBusy, database, passwords
 from trivia.game import TriviaGame
-from trivia.models import Player, commit, db_session
+from trivia.goodplace import word_filter
+from trivia.journal import journal
+from trivia.models import Player, commit
+from trivia.notify import notifier
+from trivia.scores import scoreboard
+from trivia.scrollback import Scrollback
+from trivia.sessions import resume_tokens
 
 logger = logging.getLogger(__name__)
 
-
-last_notified = None
-
-
-GOOD_PLACE = {
-    re.compile(search, re.IGNORECASE): repl
-    for search, repl in (
-        {
-            r"\b(mother|motha)?fuck(as?|ers?|s|ed|ing)?\b": r"\1fork\2",
-            r"\b(bull)?shit(s|ting)?\b": r"\1shirt\2",
-            r"\bbitch(es)?\b": r"bench\1",
-            r"\bass(holes?)?\b": r"ash\1",
-            r"\bcock(s|suckers?)?\b": r"cork\1",
-            r"\bdick(s|heads?)?\b": r"dink\1",
-            r"\bnig{2}er(s)?\b": r"nagger\1",
-            r"\bcunt(s)?\b": r"count\1",
-        }
-    ).items()
-}
-
-
-def send_pushover(message):
-    app_token = os.getenv("PUSHOVER_APP_TOKEN")
-    user_token = os.getenv("PUSHOVER_USER_TOKEN")
-    if app_token is not None and user_token is not None:
-        logger.info(f"Notifying admin: {message}.")
-        url = f"https://api.pushover.net/1/messages.json"
-        requests.post(
-            url, data={"token": app_token, "user": user_token, "message": message},
-        )
-
-
-async def notify_online_player(name):
-    """Send a Pushover notification that a player is online."""
-    global last_notified
-
-    if os.getenv("ADMIN_NICK", None) == name:
-        return
-
-    delay = 60 * 15  # 15 minutes
-    if last_notified is None or last_notified + delay < time.time():
-        send_pushover(f"Player {name} is now online!")
-        last_notified = time.time()
+# keys of player list entries, unique in the process so that a client
+# moving between rooms can't mistake one player for another
+player_keys = itertools.count(1)
 
 
 class GameController(object):
@@ -64,12 +30,16 @@ class GameController(object):
 
     """
 
-    CHAT_SCROLLBACK = 50
+    CHAT_SCROLLBACK = int(os.environ.get("CHAT_SCROLLBACK", 50))
+    PRESENCE_WINDOW = 1.0
+    PRESENCE_NAMES = 2
+    BUSY_RETRY = 2.0  # seconds, clients back off further with jitter
 
     COMMANDS = [
         "help",
         "rules",
         "login",
+        "resume",
         "admin",
         "vote",
         "start",
@@ -87,6 +57,7 @@ class GameController(object):
             "*/vote* - Rate a question after a round.",
             "*/next* - Skip to next question.",
             "*/info* - More info about TriviaRoyale",
+            "*/join* - Switch to another room.",
             "Use /help _<command>_ for more info.",
             "All commands may also be prefixed with *!* or a dot *.* instead of a slash */*.",
         ],
@@ -98,6 +69,10 @@ class GameController(object):
         "hint": [
             "*/hint* Request a new hint for the current question, if possible. Shorthand: */h*",
         ],
+        "join": [
+            "*/join <room>* - Switch to another game room, it will be opened if needed.",
+            "Use */join* without a room to see where you are.",
+        ],
         "next": [
             "*/next* Skip the current waiting time between rounds. (Shorthand: */n*)",
             "Only possible if you have a streak of at least 5.",
@@ -107,7 +82,8 @@ class GameController(object):
     def __init__(self):
         self.clients = set()
         self.players = {}
-        self.chat_scrollback = []
+        self.chat_scrollback = Scrollback(self.CHAT_SCROLLBACK)
+        self.presence = None
 
         self.trivia = None
         self.send = None
@@ -127,49 +103,61 @@ class GameController(object):
         Remove the client from the connected list.
         Also remove the Player object if the client was logged in.
 
+        Returns the removed player, if any.
+
         """
+        player = None
         if ws in self.clients:
             if ws in self.players:
                 player = self.players[ws]
                 del self.players[ws]
                 self.trivia.player_count -= 1
-                asyncio.ensure_future(
-                    self.broadcast(
-                        {
-                            "system": "{} left.".format(player["name"]),
-                            "setinfo": self._get_player_info(),
-                        }
-                    )
-                )
+                self._queue_presence("left", player)
                 logger.info("Leave: {} (#{})".format(player["name"], player["id"]))
             self.clients.remove(ws)
+        return player
+
+    def enter(self, ws, player, since=None):
+        """
+        Let a logged in player into the game.
+
+        Only chat lines after ``since`` are sent if the client has seen
+        that line from this scrollback already.
+
+        """
+        player["key"] = next(player_keys)
+        self.players[ws] = player
+        asyncio.ensure_future(self.send(ws, self.chat_scrollback.since(since)))
+        self._set_name(ws, player["id"], player["name"])
+        asyncio.ensure_future(
+            self.send(ws, {"setinfo": self._get_player_info()}, key="players")
+        )
+        asyncio.ensure_future(
+            self.send(ws, {"state": self.trivia.get_state()}, key="game")
+        )
+        self._issue_token(ws)
+
+    def _issue_token(self, ws):
+        token = resume_tokens.issue(self.players[ws])
+        asyncio.ensure_future(self.send(ws, {"resume": token}))
 
     def _set_name(self, ws, player_id, name, old_name=None):
         asyncio.ensure_future(self.send(ws, {"setinfo": {"playername": name}}))
         if old_name is None:
             self.trivia.player_count += 1
-            asyncio.ensure_future(
-                self.broadcast(
-                    {
-                        "system": "{} joined.".format(name),
-                        "setinfo": self._get_player_info(),
-                    }
-                )
-            )
+            self._queue_presence("joined", self.players[ws])
             logger.info("Join: {} (#{})".format(name, player_id))
-            asyncio.ensure_future(notify_online_player(name))
+            notifier.player_online(name)
         else:
             asyncio.ensure_future(
                 self.broadcast(
-                    {
-                        "system": "{} is now known as *{}*.".format(old_name, name),
-                        "setinfo": self._get_player_info(),
-                    }
+                    {"system": "{} is now known as *{}*.".format(old_name, name)}
                 )
             )
+            self._queue_presence("renamed", self.players[ws])
             logger.info("Rename: {} to {} (#{})".format(name, old_name, player_id))
 
-    def _rename_player(self, ws, new_name):
+    async def _rename_player(self, ws, new_name):
         player = self.players[ws]
 
         if player["name"] == new_name:
@@ -179,41 +167,115 @@ class GameController(object):
                 )
             )
         else:
-            with db_session():
+
+            def rename(player_id):
                 if Player.exists(lambda p: p.name == new_name):
-                    asyncio.ensure_future(
-                        self.send(
-                            ws,
-                            {
-                                "system": "This name is not available: *{}*.".format(
-                                    new_name
-                                ),
-                            },
-                        )
+                    return False
+                Player[player_id].set(name=new_name)
+                return True
+
+            if not await database.run(rename, player["id"]):
+                asyncio.ensure_future(
+                    self.send(
+                        ws,
+                        {"system": "This name is not available: *{}*.".format(new_name)},
                     )
-                else:
-                    old_name = player["name"]
-                    player["name"] = new_name
-                    Player[player["id"]].set(name=new_name)
-                    self._set_name(ws, player["id"], new_name, old_name=old_name)
+                )
+            else:
+                old_name = player["name"]
+                player["name"] = new_name
+                self._set_name(ws, player["id"], new_name, old_name=old_name)
+                resume_tokens.revoke(player["id"])
+                self._issue_token(ws)
 
-    def _get_player_info(self):
-        players = sorted(self.players.values(), key=lambda p: p["joined"])
+    def _queue_presence(self, event, player):
+        """
+        Buffer joins, leaves and renames for one combined broadcast.
+
+        """
+        if self.presence is None:
+            self.presence = {"joined": {}, "left": {}, "renamed": {}}
+            asyncio.get_event_loop().call_later(
+                self.PRESENCE_WINDOW, self._flush_presence
+            )
+        self.presence[event][player["key"]] = (player["id"], player["name"])
+
+    @classmethod
+    def _name_list(cls, names):
+        if len(names) <= cls.PRESENCE_NAMES + 1:
+            shown, rest = names[:-1], names[-1]
+        else:
+            shown = names[: cls.PRESENCE_NAMES]
+            rest = "{} others".format(len(names) - cls.PRESENCE_NAMES)
+        return "{} and {}".format(", ".join(shown), rest) if shown else rest
+
+    def _flush_presence(self):
+        presence, self.presence = self.presence, None
+        joined, left = presence["joined"], presence["left"]
+        removed = list(left.keys())
+        # don't announce a reconnect blip within the window, a resumed
+        # session has a new key but the same player id
+        blips = {i for i, name in joined.values()} & {i for i, name in left.values()}
+        joined_names = [name for i, name in joined.values() if i not in blips]
+        left_names = [name for i, name in left.values() if i not in blips]
+
+        events = []
+        if joined_names:
+            events.append("{} joined.".format(self._name_list(joined_names)))
+        if left_names:
+            events.append("{} left.".format(self._name_list(left_names)))
+
+        added = dict(joined)
+        added.update(presence["renamed"])
+        message = {
+            "setinfo": {"playercount": self._get_player_count()},
+            "players_delta": {
+                "add": [
+                    [k, name] for k, (i, name) in added.items() if k not in removed
+                ],
+                "remove": removed,
+            },
+        }
+        if events:
+            message["system"] = " ".join(events)
+        asyncio.ensure_future(self.broadcast(message))
+
+    def _get_player_count(self):
         count = len(self.players)
+        return "{} Player{}".format(count, "s" if count != 1 else "")
+
+    def _get_player_info(self):
+        """
+        All players in join order, as [key, name] pairs.
+
+        """
         return {
-            "playercount": "{} Player{}".format(count, "s" if count != 1 else ""),
-            "players": list(map(lambda player: player["name"], players)),
+            "playercount": self._get_player_count(),
+            "players": [
+                [player["key"], player["name"]] for player in self.players.values()
+            ],
         }
 
-    @db_session
-    def _set_password(self, ws, password):
+    async def _set_password(self, ws, password):
         player = self.players[ws]
-        player = Player[self.players[ws]["id"]]
-        player.set_password(password)
+        try:
+            password_hash = await passwords.hash(ws, password, Player.BCRYPT_ROUNDS)
+        except PasswordsBusy:
+            return self._busy(ws)
+
+        def save(player_id):
+            Player[player_id].password_hash = password_hash
+
+        await database.run(save, player["id"])
+        resume_tokens.revoke(player["id"])
+        if ws in self.players:
+            self._issue_token(ws)
         asyncio.ensure_future(
             self.send(ws, {"system": "Password successfully changed!"})
         )
-        logger.info("Password: {} set new password.".format(player))
+        logger.info(
+            "Password: {} (#{}) set new password.".format(player["name"], player["id"])
+        )
 
     def command(self, ws, command, args):
         if command.startswith("_"):
@@ -227,16 +289,18 @@ class GameController(object):
         if command in self.COMMANDS and hasattr(self, command):
             fun = getattr(self, command)
             if args is None:
-                fun(ws)
+                result = fun(ws)
             elif isinstance(args, dict):
-                fun(ws, **args)
+                result = fun(ws, **args)
             elif isinstance(args, list):
-                fun(ws, *args)
+                result = fun(ws, *args)
             else:
-                fun(ws, args)
+                result = fun(ws, args)
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(result)
             logger.debug(
                 "Ran command from {}: {} with {}".format(
-                    self.players[ws]["name"], command, args
+                    self.players.get(ws, {}).get("name"), command, args
                 )
             )
         else:
@@ -332,8 +396,49 @@ class GameController(object):
         ):
             self.trivia.next_round()
 
-    @db_session
-    def login(self, ws, login=None, password=None, *, auto=False, **kwargs):
+    @staticmethod
+    def _find_player(login):
+        """
+        Find or register a player.
+
+        """
+        player = Player.get(lambda p: p.name == login)
+
+        if player is None:
+            player = Player(name=login)
+            commit()
+
+        return {
+            "id": player.id,
+            "name": player.name,
+            "permissions": player.permissions,
+            "password_hash": player.password_hash,
+            "rounds": player.get_recent_rounds(),
+        }
+
+    async def _check_password(self, ws, player, password):
+        if not player["password_hash"]:
+            return True
+        if password is None:
+            return False
+        return await passwords.verify(ws, password, player["password_hash"])
+
+    def _busy(self, ws, command="login"):
+        """
+        Tell a client to send command again later, see ``retryBusy`` in app.js.
+
+        """
+        asyncio.ensure_future(
+            self.send(
+                ws,
+                {
+                    "system": "Server busy, trying again in a moment.",
+                    "busy": {"command": command, "retry": self.BUSY_RETRY},
+                },
+            )
+        )
+
+    async def login(self, ws, login=None, password=None, *, auto=False, **kwargs):
         """
         Register a player, set and change password and change nickname multi-function.
 
@@ -344,15 +449,16 @@ class GameController(object):
 
         if ws in self.players.keys():
             if password is not None:
-                return self._set_password(ws, password)
-            return self._rename_player(ws, login)
+                return await self._set_password(ws, password)
+            return await self._rename_player(ws, login)
 
-        player = Player.get(lambda p: p.name == login)
+        player = await database.run(self._find_player, login)
+        try:
+            valid = await self._check_password(ws, player, password)
+        except PasswordsBusy:
+            return self._busy(ws)
 
-        if player is None:
-            player = Player(name=login)
-            commit()
-        elif not player.check_password(password):
+        if not valid:
             if password is None or auto:
                 asyncio.ensure_future(
                     self.send(
@@ -360,7 +466,6 @@ class GameController(object):
                         {"prompt": "password", "data": {"login": login, "auto": True}},
                     )
                 )
-                return
             else:
                 asyncio.ensure_future(
                     self.send(
@@ -372,33 +477,55 @@ class GameController(object):
                         },
                     )
                 )
-                return
+            return
 
-        player.logged_in()
+        if ws in self.players or ws not in self.clients:
+            # logged in or disconnected in the meantime
+            return
 
-        self.players[ws] = {
-            "joined": time.time(),
-            "id": player.id,
-            "name": player.name,
-            "permissions": player.permissions,
-        }
-        asyncio.ensure_future(self.send(ws, self.chat_scrollback))
-        self._set_name(ws, player.id, player.name)
+        journal.player(player["id"], datetime.utcnow())
+        self.enter(
+            ws,
+            {
+                "joined": time.time(),
+                "id": player["id"],
+                "name": player["name"],
+                "permissions": player["permissions"],
+            },
+        )
 
-        if not player.has_password():
+        if not player["password_hash"]:
             asyncio.ensure_future(
                 self.send(
                     ws,
                     {
                         "system": "You currently have no password! Your nickname is not protected.",
                         "system_extra": "<a href=\"#\" onclick=\"showModal('password', {{login:'{}'}})\">"
-                        "Click here to set a password!</a>".format(player.name),
+                        "Click here to set a password!</a>".format(player["name"]),
                     },
                 )
             )
 
-        asyncio.ensure_future(self.send(ws, {"setinfo": player.get_recent_scores()}))
-        asyncio.ensure_future(self.send(ws, {"setinfo": self.trivia.get_round_info()}))
+        scores = scoreboard.seed(player["id"], player["rounds"])
+        asyncio.ensure_future(self.send(ws, {"setinfo": scores}, key="scores"))
+
+    def resume(self, ws, token=None, since=None, **kwargs):
+        """
+        Restore a session from a resume token, without a full login.
+
+        """
+        if ws in self.players:
+            return
+        player = resume_tokens.verify(token)
+        if player is None:
+            asyncio.ensure_future(self.send(ws, {"resume": None}))
+            return
+        player["joined"] = time.time()
+        self.enter(ws, player, since=since)
+
+        scores = scoreboard.get(player["id"])
+        if scores is not None:
+            asyncio.ensure_future(self.send(ws, {"setinfo": scores}, key="scores"))
 
     def admin(self, ws, *args, **kwargs):
         """
@@ -408,7 +535,7 @@ class GameController(object):
         player = self.players[ws]
         if player["permissions"] > 0:
             admin_command = AdminCommand(self.trivia, player["id"])
-            admin_command.run(args[0], *args[1:])
+            asyncio.ensure_future(admin_command.run(args[0], *args[1:]))
 
     def chat(self, ws, text):
         player = self.players[ws]
@@ -416,6 +543,7 @@ class GameController(object):
         entry = {
             "player": player["name"],
             "text": good_text,
+            "seq": Scrollback.next_seq(),
         }
         asyncio.ensure_future(self.broadcast(entry))
         entry.update(time=int(time.time()))
@@ -428,15 +556,12 @@ class GameController(object):
 
     def good_place(self, text):
         """This is a good place."""
-        for r, repl in GOOD_PLACE.items():
-            text = r.sub(repl, text)
-
-        return text
+        if text is None:
+            return None
+        return word_filter.sub(text)
 
     def append_chat_log(self, entry):
         self.chat_scrollback.append(entry)
-        if len(self.chat_scrollback) > self.CHAT_SCROLLBACK:
-            self.chat_scrollback = self.chat_scrollback[1:]
 
 
 class AdminCommand(object):
@@ -449,15 +574,19 @@ class AdminCommand(object):
         self.game = game
         self.player_id = player_id
 
-    def run(self, cmd, *args):
+    async def run(self, cmd, *args):
         if hasattr(self, cmd):
-            with db_session():
+
+            def check_perm():
                 player = Player[self.player_id]
-                if player.has_perm(cmd):
-                    logger.info("{} executed: {}({!r})".format(player.name, cmd, args))
-                    return getattr(self, cmd)(self, *args)
-                else:
-                    logger.warn("{} has no access to: {}".format(player, cmd))
+                return str(player), player.has_perm(cmd)
+
+            player, allowed = await database.run(check_perm)
+            if allowed:
+                logger.info("{} executed: {}({!r})".format(player, cmd, args))
+                return getattr(self, cmd)(self, *args)
+            else:
+                logger.warn("{} has no access to: {}".format(player, cmd))
         else:
             logger.info(
                 "Player #{} triggered unknown command: {}".format(self.player_id, cmd)
@@ -0,0 +1,187 @@
+import asyncio
+import itertools
+import logging
+import os
+import socket
+
+from trivia.fanout import FanOut, Prepared
+
+logger = logging.getLogger(__name__)
+
+
+AUTHORITY_CHANNEL = "authority"
+
+
+def edge_channel(edge_id):
+    return "edge:{}".format(edge_id)
+
+
+class RemoteClient(object):
+    """
+    Stands in for a websocket held by an edge process.
+
+    """
+
+    open = True
+
+    def __init__(self, bus, edge_id, conn):
+        self.bus = bus
+        self.edge_id = edge_id
+        self.conn = conn
+
+    def __repr__(self):
+        return "<RemoteClient {}>".format(self.conn)
+
+    async def close(self, code=1000, reason=""):
+        self.open = False
+        self.bus.publish(
+            edge_channel(self.edge_id),
+            {"op": "close", "conn": self.conn, "code": code, "reason": reason},
+        )
+
+
+class ClusterFanOut(FanOut):
+    """
+    Fan-out that forwards messages for remote clients to their edges.
+
+    Each edge receives a single bus message per broadcast, carrying the
+    recipients and the message to encode and deliver locally.
+
+    """
+
+    def __init__(self, bus):
+        super().__init__()
+        self.bus = bus
+
+    def _publish(self, edge_id, conns, message, key):
+        if isinstance(message, Prepared):
+            message = message.message
+        self.bus.publish(
+            edge_channel(edge_id),
+            {"op": "send", "to": conns, "message": message, "key": key},
+        )
+
+    def send(self, ws, message, key=None):
+        if isinstance(ws, RemoteClient):
+            self._publish(ws.edge_id, [ws.conn], message, key)
+        else:
+            super().send(ws, message, key)
+
+    def broadcast(self, clients, message, key=None):
+        local, edges = [], {}
+        for ws in clients:
+            if isinstance(ws, RemoteClient):
+                edges.setdefault(ws.edge_id, []).append(ws.conn)
+            else:
+                local.append(ws)
+        for edge_id, conns in edges.items():
+            self._publish(edge_id, conns, message, key)
+        if local:
+            super().broadcast(local, message, key)
+
+
+class Authority(object):
+    """
+    Game authority, runs all rooms for the sockets held by edges.
+
+    """
+
+    def __init__(self, bus, rooms, handle):
+        self.bus = bus
+        self.rooms = rooms
+        self.handle = handle
+        self.clients = {}
+
+        bus.subscribe(AUTHORITY_CHANNEL, self.receive)
+        bus.on_peer_lost(self.peer_lost)
+
+    def receive(self, event):
+        op, conn = event.get("op"), event.get("conn")
+
+        if op == "open":
+            client = RemoteClient(self.bus, event["edge"], conn)
+            if self.rooms.enter(client, event.get("path")) is None:
+                asyncio.ensure_future(client.close(1013, "Room not available"))
+            else:
+                self.clients[conn] = client
+
+        elif op == "message" and conn in self.clients:
+            asyncio.ensure_future(self.handle(self.clients[conn], event["data"]))
+
+        elif op == "close" and conn in self.clients:
+            self._drop(conn)
+
+    def _drop(self, conn):
+        client = self.clients.pop(conn)
+        client.open = False
+        self.rooms.leave(client)
+
+    def peer_lost(self, channels):
+        for conn, client in list(self.clients.items()):
+            if edge_channel(client.edge_id) in channels:
+                self._drop(conn)
+
+
+class Edge(object):
+    """
+    Edge process, only holds sockets and relays to the authority.
+
+    """
+
+    def __init__(self, bus, fanout, edge_id=None):
+        self.bus = bus
+        self.fanout = fanout
+        self.edge_id = edge_id or "{}-{}".format(socket.gethostname(), os.getpid())
+        self.ids = itertools.count(1)
+        self.conns = {}
+        self.sockets = {}
+
+        bus.subscribe(edge_channel(self.edge_id), self.receive)
+        bus.on_peer_lost(self.peer_lost)
+
+    def open(self, ws, path):
+        conn = "{}:{}".format(self.edge_id, next(self.ids))
+        self.conns[ws] = conn
+        self.sockets[conn] = ws
+        self._publish({"op": "open", "conn": conn, "path": path})
+        return conn
+
+    def close(self, ws):
+        conn = self.conns.pop(ws, None)
+        if conn is not None:
+            del self.sockets[conn]
+            self._publish({"op": "close", "conn": conn})
+
+    def forward(self, ws, data):
+        """
+        Relay a player message to the authority, answering pings locally.
+
+        """
+        if "ping" in data:
+            data = dict(data)
+            self.fanout.send(ws, {"pong": data.pop("ping")})
+        if data and ws in self.conns:
+            self._publish({"op": "message", "conn": self.conns[ws], "data": data})
+
+    def _publish(self, event):
+        event["edge"] = self.edge_id
+        self.bus.publish(AUTHORITY_CHANNEL, event)
+
+    def receive(self, event):
+        op = event.get("op")
+        if op == "send":
+            clients = [self.sockets[c] for c in event["to"] if c in self.sockets]
+            self.fanout.broadcast(clients, event["message"], event.get("key"))
+        elif op == "close" and event.get("conn") in self.sockets:
+            ws = self.sockets[event["conn"]]
+            asyncio.ensure_future(
+                ws.close(event.get("code", 1000), event.get("reason", ""))
+            )
+
+    def peer_lost(self, channels):
+        """
+        The authority is gone, let clients reconnect once it's back.
+
+        """
+        for ws in list(self.conns.keys()):
+            asyncio.ensure_future(ws.close(1012, "Service restart"))
@@ -0,0 +1,110 @@
+import json
+import os
+from urllib.parse import parse_qs, urlsplit
+
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class JsonCodec(object):
+    """
+    JSON text frames, encoded with orjson when it's installed.
+
+    """
+
+    name = "json"
+    binary = False
+
+    def __init__(self, fast=True):
+        self.fast = fast and orjson is not None
+
+    def encode(self, message):
+        if self.fast:
+            return orjson.dumps(message).decode()
+        return json.dumps(message, separators=(",", ":"))
+
+    def decode(self, frame):
+        if self.fast:
+            return orjson.loads(frame)
+        return json.loads(frame)
+
+
+class MsgpackCodec(object):
+    """
+    MessagePack binary frames, see static/js/msgpack.js.
+
+    """
+
+    name = "msgpack"
+    binary = True
+
+    def encode(self, message):
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, frame):
+        return msgpack.unpackb(frame, raw=False)
+
+
+JSON_BACKEND = os.environ.get("JSON_BACKEND", "fast")
+
+CODECS = {"json": JsonCodec(fast=JSON_BACKEND != "stdlib")}
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec()
+
+DEFAULT = CODECS["json"]
+
+# Preferred first, clients list the ones they support.
+SUBPROTOCOLS = [name for name in ("msgpack", "json") if name in CODECS]
+
+
+def negotiate(ws, path):
+    """
+    Pick the codec for a connection by its subprotocol or ``?codec=`` parameter.
+
+    """
+    if getattr(ws, "subprotocol", None) in CODECS:
+        return CODECS[ws.subprotocol]
+    query = parse_qs(urlsplit(path or "").query)
+    return CODECS.get(query.get("codec", [None])[0], DEFAULT)
+
+
+def decode(frame):
+    """
+    Decode a client message, clients may send text or binary frames.
+
+    """
+    if isinstance(frame, bytes) and "msgpack" in CODECS:
+        return CODECS["msgpack"].decode(frame)
+    return DEFAULT.decode(frame)
+
+
+def deflate_settings():
+    """
+    Per-message deflate for ``websockets.serve``.
+
+    Smaller windows and memory levels than zlib's defaults keep the
+    compressor at a few kB per connection, game frames are small anyway.
+
+    """
+    if os.environ.get("WS_DEFLATE", "on") == "off":
+        return {"compression": None}
+    window_bits = int(os.environ.get("WS_DEFLATE_WINDOW_BITS", 12))
+    mem_level = int(os.environ.get("WS_DEFLATE_MEM_LEVEL", 5))
+    return {
+        "compression": "deflate",
+        "extensions": [
+            ServerPerMessageDeflateFactory(
+                server_max_window_bits=window_bits,
+                compress_settings={"memLevel": mem_level},
+            )
+        ],
+    }
@@ -0,0 +1,149 @@
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from passlib.hash import bcrypt_sha256
+from pony.orm import db_session
+from pony.orm.core import DBSessionContextManager
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseExecutor(object):
+    """
+    Run blocking Pony database work on a dedicated thread pool.
+
+    Every call gets its own ``db_session`` on a pool thread, so slow
+    queries never hold up the event loop. Return plain values or
+    entities with everything needed already loaded.
+
+    """
+
+    WORKERS = int(os.environ.get("DB_WORKERS", 4))
+
+    def __init__(self, workers=None):
+        self.pool = ThreadPoolExecutor(
+            max_workers=workers or self.WORKERS, thread_name_prefix="db"
+        )
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.pool, functools.partial(self._call, fn, *args, **kwargs)
+        )
+
+    @staticmethod
+    def _call(fn, *args, **kwargs):
+        with db_session():
+            return fn(*args, **kwargs)
+
+
+database = DatabaseExecutor()
+
+
+class PasswordsBusy(Exception):
+    pass
+
+
+def _hash_password(password, rounds):
+    return bcrypt_sha256.encrypt(password, rounds=rounds)
+
+
+def _verify_password(password, password_hash):
+    return bcrypt_sha256.verify(password, password_hash)
+
+
+class PasswordHasher(object):
+    """
+    Hash and verify passwords on a process pool, off the event loop.
+
+    Each connection may only have ``PER_CONNECTION`` operations in flight
+    and at most ``MAX_QUEUE`` are queued in total, anything beyond that
+    raises ``PasswordsBusy`` right away instead of piling up.
+
+    """
+
+    WORKERS = int(os.environ.get("HASH_WORKERS", os.cpu_count() or 1))
+    MAX_QUEUE = int(os.environ.get("HASH_MAX_QUEUE", 256))
+    PER_CONNECTION = 1
+
+    def __init__(self, workers=None):
+        self.workers = workers or self.WORKERS
+        self.pool = None
+        self.in_flight = {}
+        self.pending = 0
+        self.peak = 0
+        self.completed = 0
+        self.rejected = 0
+        self.busy_time = 0.0
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "peak": self.peak,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_time": self.busy_time / self.completed if self.completed else 0.0,
+        }
+
+    async def _run(self, owner, fn, *args):
+        if self.pending >= self.MAX_QUEUE or (
+            self.in_flight.get(owner, 0) >= self.PER_CONNECTION
+        ):
+            self.rejected += 1
+            logger.warn("Passwords busy: {}".format(self.stats()))
+            raise PasswordsBusy()
+
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+        self.in_flight[owner] = self.in_flight.get(owner, 0) + 1
+        self.pending += 1
+        self.peak = max(self.peak, self.pending)
+        start = time.time()
+        try:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self.pool, fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            self.busy_time += time.time() - start
+            self.in_flight[owner] -= 1
+            if not self.in_flight[owner]:
+                del self.in_flight[owner]
+            logger.debug("Passwords: {}".format(self.stats()))
+
+    async def hash(self, owner, password, rounds):
+        return await self._run(owner, _hash_password, password, rounds)
+
+    async def verify(self, owner, password, password_hash):
+        return await self._run(owner, _verify_password, password, password_hash)
+
+
+passwords = PasswordHasher()
+
+
+def guard_event_loop():
+    """
+    Debug mode: log every ``db_session`` entered on the event loop thread.
+
+    """
+    loop_thread = threading.get_ident()
+    enter = DBSessionContextManager._enter
+
+    def _enter(self):
+        if threading.get_ident() == loop_thread:
+            logger.warn(
+                "db_session entered on the event loop:\n{}".format(
+                    "".join(traceback.format_stack(limit=8)[:-1])
+                )
+            )
+        return enter(self)
+
+    DBSessionContextManager._enter = _enter
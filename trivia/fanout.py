@@ -0,0 +1,151 @@
+import asyncio
+import logging
+from collections import deque
+
+import websockets
+
+from trivia import codec
+
+logger = logging.getLogger(__name__)
+
+
+class Outbox(object):
+    """
+    Outbound frames of a single connection.
+
+    Frames are queued without waiting on the socket and written by a
+    dedicated writer task, so a slow client only ever delays itself.
+    Clients that fall too far behind are disconnected.
+
+    Frames pushed with a key are conflated: while one is still pending,
+    a newer frame with the same key replaces it in place. Frames without
+    a key are always delivered in order.
+
+    """
+
+    MAX_PENDING = 100
+    SEND_TIMEOUT = 10.0
+    CLOSE_CODE = 1013  # Try again later
+    CLOSE_REASON = "Too slow"
+
+    def __init__(self, ws, codec=codec.DEFAULT):
+        self.ws = ws
+        self.codec = codec
+        self.frames = deque()
+        self.latest = {}
+        self.conflated = 0
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.writer = asyncio.ensure_future(self.run())
+
+    def __len__(self):
+        return len(self.frames)
+
+    def push(self, frame, key=None):
+        """
+        Queue an encoded frame, never blocks.
+
+        """
+        if self.closed:
+            return False
+        if key is not None and key in self.latest:
+            self.latest[key] = frame
+            self.conflated += 1
+            return True
+        if len(self.frames) >= self.MAX_PENDING:
+            logger.warn(
+                "Disconnecting slow client: {} frames pending".format(len(self.frames))
+            )
+            self.disconnect()
+            return False
+        if key is not None:
+            self.latest[key] = frame
+        self.frames.append((key, frame))
+        self.ready.set()
+        return True
+
+    async def run(self):
+        try:
+            while True:
+                await self.ready.wait()
+                while self.frames:
+                    key, frame = self.frames.popleft()
+                    if key is not None:
+                        frame = self.latest.pop(key)
+                    await asyncio.wait_for(self.ws.send(frame), self.SEND_TIMEOUT)
+                self.ready.clear()
+        except websockets.exceptions.ConnectionClosed:
+            self.close()
+        except asyncio.TimeoutError:
+            logger.warn("Disconnecting stalled client: send timed out")
+            self.disconnect()
+
+    def disconnect(self):
+        self.close()
+        asyncio.ensure_future(self.ws.close(self.CLOSE_CODE, self.CLOSE_REASON))
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.frames.clear()
+        self.latest.clear()
+        if not self.writer.done() and self.writer is not asyncio.current_task():
+            self.writer.cancel()
+
+
+class Prepared(object):
+    """
+    A message that is encoded once per codec and reused for every send.
+
+    """
+
+    __slots__ = ("message", "frames")
+
+    def __init__(self, message):
+        self.message = message
+        self.frames = {}
+
+
+class FanOut(object):
+    """
+    Deliver messages to many connections without awaiting any of them.
+
+    Every message is encoded once per codec in use and handed to each
+    client's outbox.
+
+    """
+
+    def __init__(self):
+        self.outboxes = {}
+
+    def register(self, ws, codec=codec.DEFAULT):
+        if ws not in self.outboxes:
+            self.outboxes[ws] = Outbox(ws, codec)
+
+    def unregister(self, ws):
+        outbox = self.outboxes.pop(ws, None)
+        if outbox is not None:
+            outbox.close()
+
+    def encode(self, message, codec=codec.DEFAULT):
+        if isinstance(message, Prepared):
+            if codec.name not in message.frames:
+                message.frames[codec.name] = codec.encode(message.message)
+            return message.frames[codec.name]
+        return codec.encode(message)
+
+    def send(self, ws, message, key=None):
+        outbox = self.outboxes.get(ws)
+        if outbox is not None:
+            outbox.push(self.encode(message, outbox.codec), key)
+
+    def broadcast(self, clients, message, key=None):
+        frames = {}
+        for ws in clients:
+            outbox = self.outboxes.get(ws)
+            if outbox is not None:
+                name = outbox.codec.name
+                if name not in frames:
+                    frames[name] = self.encode(message, outbox.codec)
+                outbox.push(frames[name], key)
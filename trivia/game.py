@@ -4,7 +4,11 @@ import math
 import time
 from datetime import datetime
 
-from .models import Player, Question, Round, commit, db_session
+from .executor import database
+from .journal import journal
+from .models import Player, Question, Round, commit
+from .sampler import QuestionPool
+from .scores import scoreboard
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +25,8 @@ class TriviaGame(object):
     STATE_WAITING = "waiting"
     STATE_LOCKED = "locked"
 
+    PROTOCOL_VERSION = 1
+
     ROUND_TIME = 45.0
     WAIT_TIME = 15.0
     WAIT_TIME_NEW_ROUND = 10.0
@@ -40,105 +46,90 @@ class TriviaGame(object):
         self.queue = asyncio.Queue()
         self.last_action = time.time()
         self.timeout = None
+        self.chat_task = None
         self.timer_start = None
         self.round = None
+        self.question = None
+        self.result = None
+        self.round_started = None
+        self.prefetch = None
+        self.prefetch_lead = None
+        self.switching = False
+        self.questions = QuestionPool()
         self.player_count = 0
         self._reset_hints()
         self._reset_streak()
         self._reset_votes()
 
-    def get_round_info(self):
-        elapsed_time = (time.time() - self.timer_start) if self.timer_start else 0
-        timer = ""
+    def get_state(self):
+        """
+        The game state for clients to render, see ``renderGame`` in app.js.
 
-        if self.state == self.STATE_QUESTION:
-            game = (
-                '<p class="question-info">#{round.id}</p>'
-                '<p class="question-categories">{round.question.category_names}</p>'
-                '<p class="question">{round.question.question}</p>'
-            ).format(round=self.round)
-
-            if self.hints["current"] is not None:
-                game += '<p class="question-hint">{}</p>'.format(self.hints["current"])
-
-            if self.hint_available(ignore_cooldown=True):
-                game += '<p><button class="tiny z2" onclick="command(\'hint\')">Get hint</button></p>'
-
-            timer = (
-                '<div class="timer-bar" style="width:{width}%" '
-                'data-total-time="{total_time}" data-time-left="{time_left}"></div>'
-                '<div class="timer-value"><span>{time_left:.2f}</span>s</div>'
-            ).format(
-                width=(self.ROUND_TIME - elapsed_time) / self.ROUND_TIME * 100.0,
-                total_time=self.ROUND_TIME,
-                time_left=self.ROUND_TIME - elapsed_time,
-            )
+        Timers are sent as server timestamps along with the current server
+        time, clients count down on their own. While a round runs, only new
+        hints are sent, see ``get_hint_delta``.
 
-        elif self.state == self.STATE_WAITING:
-            game = '<p class="question-info">#{round.id}</p>'.format(round=self.round)
-            answer = self.round.question.primary_answer
-
-            if self.round.solved:
-                game += (
-                    "<p><b>{round.solver.name}</b> got "
-                    "<b>{round.points}</b> points for answering in <b>{round.time_taken:.2f}s</b>: "
-                    "<br>{round.question.question}</p>"
-                ).format(round=self.round)
-                game += "<p>Correct answer: <b>{}</b></p>".format(answer)
-            else:
-                game += (
-                    "<p>{round.question.question}</p><p><b>Time's up!</b> "
-                    "Nobody got the answer: <b>{answer}</b></p>"
-                ).format(round=self.round, answer=answer)
-
-            game += (
-                '<p id="question-vote" class="question-vote">'
-                '<button class="tiny positive z2" onclick="command(\'vote\', 1)">Good Question</button>'
-                '<button class="tiny negative z2" onclick="command(\'vote\', -1)">Bad Question</button></p>'
-            )
+        """
+        state = {
+            "v": self.PROTOCOL_VERSION,
+            "state": self.state,
+            "now": time.time(),
+        }
 
-            timer = (
-                '<div class="timer-bar colorless" style="width:{width}%" data-time-left="{time_left}"></div>'
-                '<div class="timer-value">Next round in: <span>{time_left}</span>s</div>'
-            ).format(
-                width=(self.WAIT_TIME - elapsed_time) / self.WAIT_TIME * 100.0,
-                time_left=self.WAIT_TIME - elapsed_time,
+        if self.state == self.STATE_QUESTION:
+            state.update(
+                round=self.round.id,
+                question=self.question.question,
+                categories=self.question.categories,
+                started=self.timer_start,
+                deadline=self.timer_start + self.ROUND_TIME,
+                hint=self.hints["current"],
+                hints=self.hints["count"],
+                hint_max=self.HINT_MAX,
+                hint_timing=self.HINT_TIMING,
             )
 
-        elif self.state == self.STATE_IDLE:
-            game = (
-                "<p>TriviaRoyale is not running.</p>"
-                '<p><button class="z1" onclick="command(\'start\')">Start new round</button></p>'
-                '<p>Coming soon: <strong>TriviaRoyale 2.0!</strong></p>'
-                '<p class="social-flex"><a target="_blank" href="https://twitter.com/triviaroyaleio" class="button tiny social">'
-                '<svg width="16" height="16" fill="currentColor" class="btn-icon" viewBox="0 0 24 24"><path d="M24 4.6a10 10 0 0 1-2.9.7 5 5 0 0 0 2.2-2.7c-1 .6-2 1-3.1 1.2a5 5 0 0 0-8.4 4.5A14 14 0 0 1 1.6 3.2 4.8 4.8 0 0 0 1 5.6a5 5 0 0 0 2.2 4.1 4.9 4.9 0 0 1-2.3-.6A5 5 0 0 0 5 14a5 5 0 0 1-2.2 0 5 5 0 0 0 4.6 3.5 9.9 9.9 0 0 1-6.1 2.1H0a14 14 0 0 0 7.6 2.2c9 0 14-7.5 14-14V7A10 10 0 0 0 24 4.6z"/></svg>'
-                'Follow on Twitter</a><a target="_blank" href="https://beta.triviaroyale.io/blog/subscribe/" class="button tiny social">'
-                '<svg width="16" height="16" class="btn-icon" viewBox="0 0 20 20" fill="currentColor"><path d="M2.003 5.884L10 9.882l7.997-3.998A2 2 0 0016 4H4a2 2 0 00-1.997 1.884z" /><path d="M18 8.118l-8 4-8-4V14a2 2 0 002 2h12a2 2 0 002-2V8.118z" /></svg>'
-                "Subscribe to newsletter</a></p>"
+        elif self.state == self.STATE_WAITING:
+            state.update(
+                round=self.round.id,
+                question=self.question.question,
+                answer=self.question.answer,
+                result=self.result,
+                started=self.timer_start,
+                deadline=self.timer_start + self.WAIT_TIME,
             )
 
         elif self.state == self.STATE_STARTING:
-            game = "<p>New round starting in a few seconds...</p>"
-            timer = (
-                '<div class="timer-bar colorless" style="width:{width}%" data-time-left="{time_left}"></div>'
-                '<div class="timer-value">Starting in: <span>{time_left}</span>s</div>'
-            ).format(
-                width=(self.WAIT_TIME_NEW_ROUND - elapsed_time)
-                / self.WAIT_TIME_NEW_ROUND
-                * 100.0,
-                time_left=self.WAIT_TIME_NEW_ROUND - elapsed_time,
+            state.update(
+                started=self.timer_start,
+                deadline=self.timer_start + self.WAIT_TIME_NEW_ROUND,
             )
 
-        elif self.state == self.STATE_LOCKED:
-            game = "<p>TriviaRoyale is stopped.</p><p>Only an administrator can start it.</p>"
+        return state
 
+    def get_hint_delta(self):
         return {
-            "game": game,
-            "timer": timer,
+            "v": self.PROTOCOL_VERSION,
+            "round": self.round.id,
+            "hint": self.hints["current"],
+            "hints": self.hints["count"],
         }
 
     async def run(self):
-        asyncio.ensure_future(self.run_chat())
+        # the question pool is loaded when a game starts, see delay_new_round
+        self.chat_task = asyncio.ensure_future(self.run_chat())
+
+    def close(self):
+        """
+        Shut down this game for good.
+
+        """
+        if self.timeout is not None:
+            self.timeout.cancel()
+        if self.chat_task is not None:
+            self.chat_task.cancel()
+        if self.prefetch is not None:
+            self.prefetch.cancel()
 
     async def chat(self, ws, player, text):
         await self.queue.put((ws, player, text))
@@ -153,7 +144,7 @@ class TriviaGame(object):
             self.last_action = time.time()
 
             if self.state == self.STATE_QUESTION:
-                if self.round.question.check_answer(text):
+                if self.question.check_answer(text):
                     asyncio.get_event_loop().call_soon_threadsafe(self.timeout.cancel)
                     asyncio.ensure_future(self.round_solved(ws, player))
 
@@ -173,49 +164,70 @@ class TriviaGame(object):
                 "count": 1,
             }
 
-        with db_session():
-            player_db = Player.get(lambda p: p.name == player["name"])
-            played_round = Round[self.round.id]
-            played_round.solved_by(
-                player_db,
-                self.ROUND_TIME,
-                hints=self.hints["count"],
-                streak=self.streak["count"],
-            )
-            played_round.end_round()
-            self.round = played_round
-
-        asyncio.ensure_future(
-            self.send(
-                ws,
-                {
-                    "setinfo": player_db.get_recent_scores(),
-                    # track conversion goal for round solved
-                    "log_event": ["trackGoal", 1],
-                },
-            )
+        question = self.question
+        time_taken = time.time() - self.timer_start
+        points = self.round.question.calculate_points(
+            time_taken / self.ROUND_TIME, self.hints["count"], self.streak["count"]
+        )
+        self.result = {
+            "solver": player["name"],
+            "points": points,
+            "time_taken": time_taken,
+        }
+        journal.round(
+            self.round.id,
+            self.round_started,
+            solver=player["id"],
+            points=points,
+            time_taken=time_taken,
         )
+        journal.question(
+            question.id, times_played=1, times_solved=1, last_played=datetime.utcnow()
+        )
+        self.questions.played(question.id, solved=True)
+
+        scores = scoreboard.add(player["id"], self.round_started, points)
+        if scores is not None:
+            asyncio.ensure_future(self.send(ws, {"setinfo": scores}, key="scores"))
+        else:
+            asyncio.ensure_future(self.send_scores(ws, player["id"]))
+        # track conversion goal for round solved
+        asyncio.ensure_future(self.send(ws, {"log_event": ["trackGoal", 1]}))
 
         asyncio.ensure_future(self.round_end())
         logger.info(
             "#{} END: {} for {} points ({} hints used) in {:.2f}s: {}".format(
                 self.round.id,
-                self.round.solver,
-                self.round.points,
+                player["name"],
+                points,
                 self.hints["count"],
-                self.round.time_taken,
-                self.round.question,
+                time_taken,
+                question,
             )
         )
 
+    async def send_scores(self, ws, player_id):
+        """
+        Track a player's scores again after they went idle for too long.
+
+        """
+        await journal.flush()
+        rounds = await database.run(lambda: Player[player_id].get_recent_rounds())
+        scores = scoreboard.seed(player_id, rounds)
+        asyncio.ensure_future(self.send(ws, {"setinfo": scores}, key="scores"))
+
     def next_round(self):
         """
         Skip to the next round.
 
         """
-        if self.state == self.STATE_WAITING and self.timeout is not None:
+        if (
+            self.state == self.STATE_WAITING
+            and self.timeout is not None
+            and not self.switching
+        ):
             asyncio.get_event_loop().call_soon_threadsafe(self.timeout.cancel)
-            asyncio.ensure_future(self.start_new_round())
+            asyncio.ensure_future(self.start_new_round(self.STATE_WAITING))
 
     def stop_game(self, reason=None, lock=False):
         """
@@ -249,8 +261,13 @@ class TriviaGame(object):
             self.round_start = datetime.utcnow()
             self._reset_streak()
             self.broadcast_info()
+            await self.questions.load()
         else:
             self.state = self.STATE_WAITING
+        state = self.state
+
+        if self.prefetch is None:
+            self.prefetch = asyncio.ensure_future(self.prefetch_round())
 
         await asyncio.sleep(wait)
 
@@ -265,29 +282,93 @@ class TriviaGame(object):
                 )
             )
         else:
-            asyncio.ensure_future(self.start_new_round())
-
-    async def start_new_round(self):
-        self.save_votes()
-
-        with db_session():
-            try:
-                new_round = Round.new(self.round_start)
-            except IndexError:
-                self.round_start = datetime.utcnow()
-                new_round = Round.new(self.round_start)
-            commit()
-            self.round = new_round
-        timeout = asyncio.ensure_future(self.round_timeout())
-        asyncio.ensure_future(self.broadcast_update(timeout))
-
-        self.timeout = timeout
+            asyncio.ensure_future(self.start_new_round(state))
+
+    async def prefetch_round(self):
+        """
+        Pick the next question and load everything a round needs from it,
+        while the previous round is still waiting.
+
+        The round itself is only created once it starts, so a prefetch that
+        is never used leaves nothing behind in the database.
+
+        """
+        try:
+            question_id = self.questions.draw(self.round_start)
+        except IndexError:
+            self.round_start = datetime.utcnow()
+            question_id = self.questions.draw(self.round_start)
+        self.questions.played(question_id)
+
+        question = await database.run(
+            lambda: Question[question_id].prepare(self.HINT_MAX)
+        )
+        return question, time.time()
+
+    @staticmethod
+    def create_round(question_id):
+        new_round = Round.new(question_id)
+        commit()
+        return new_round
+
+    @staticmethod
+    def delete_round(round_id):
+        Round[round_id].delete()
+        commit()
+
+    async def start_new_round(self, from_state):
+        """
+        Switch to the prefetched round, if the game is still in from_state
+        once it's ready and no other switch is under way.
+
+        """
+        if self.state != from_state or self.switching:
+            return
+        if self.prefetch is None:
+            self.prefetch = asyncio.ensure_future(self.prefetch_round())
+
+        new_round = None
+        self.switching = True
+        switch_time = time.time()
+        try:
+            question, ready = await self.prefetch
+            if self.state == from_state:
+                new_round = await database.run(self.create_round, question.id)
+        except Exception:
+            self.prefetch = None
+            raise
+        finally:
+            self.switching = False
+        if self.state != from_state:
+            # stopped meanwhile, the prefetched question is kept for the next start
+            if new_round is not None:
+                asyncio.ensure_future(database.run(self.delete_round, new_round.id))
+            return
+        self.prefetch = None
+        # negative if the round had to wait for the prefetch
+        self.prefetch_lead = switch_time - ready
+
+        previous_round, votes = self.round, self.votes
+        self.round = new_round
+        self.question = question
+        self.result = None
+        self.round_started = datetime.utcnow()
+
+        self.timeout = asyncio.ensure_future(self.round_timeout())
         self.state = self.STATE_QUESTION
         self.timer_start = time.time()
         self._reset_hints()
         self._reset_votes()
         self.announce("Round #{}".format(self.round.id))
+        # keyed, so it replaces a state still queued for a slow client
         self.broadcast_info()
+        logger.info(
+            "#{} START: prefetched {:.2f}s ahead".format(
+                self.round.id, self.prefetch_lead
+            )
+        )
+
+        asyncio.ensure_future(self.save_votes(previous_round, votes))
 
     async def round_timeout(self):
         """
@@ -295,11 +376,13 @@ class TriviaGame(object):
 
         """
         await asyncio.sleep(self.ROUND_TIME)
-        with db_session():
-            end_round = Round[self.round.id]
-            end_round.end_round()
-            self.round = end_round
-        logger.info("#{} END: NO WINNER: {}".format(self.round.id, self.round.question))
+
+        journal.round(self.round.id, self.round_started)
+        journal.question(
+            self.question.id, times_played=1, last_played=datetime.utcnow()
+        )
+        self.questions.played(self.question.id)
+        logger.info("#{} END: NO WINNER: {}".format(self.round.id, self.question))
         asyncio.ensure_future(self.round_end())
 
     async def round_end(self):
@@ -307,26 +390,10 @@ class TriviaGame(object):
         self.timer_start = time.time()
         self.broadcast_info()
         self.timeout = asyncio.ensure_future(self.delay_new_round())
-
-    async def broadcast_update(self, fut, num=1):
-        """
-        Periodically update the game info to all clients.
-        Mainly used to announce new hint availability.
-
-        :param fut: Current round timeout future.
-
-        """
-        await asyncio.sleep(self.HINT_TIMING)
-        if fut.cancelled():
-            return
-
-        self.broadcast_info()
-
-        if num + 1 < self.HINT_MAX:
-            asyncio.ensure_future(self.broadcast_update(fut, num + 1))
+        await journal.flush()
 
     def broadcast_info(self):
-        asyncio.ensure_future(self.broadcast({"setinfo": self.get_round_info(),}))
+        asyncio.ensure_future(self.broadcast({"state": self.get_state()}, key="game"))
 
     def announce(self, message):
         asyncio.ensure_future(self.broadcast({"system": message, "announce": True,}))
@@ -395,8 +462,10 @@ class TriviaGame(object):
             logger.info("#{} HINT: {}".format(self.round.id, from_player))
             self.hints["time"] = time.time()
             self.hints["count"] += 1
-            self.hints["current"] = self.round.question.get_hint(self.hints["count"])
-            self.broadcast_info()
+            self.hints["current"] = self.question.hints[self.hints["count"] - 1]
+            asyncio.ensure_future(
+                self.broadcast({"state_delta": self.get_hint_delta()}, key="hint")
+            )
 
     def _reset_votes(self):
         self.votes = {
@@ -422,19 +491,18 @@ class TriviaGame(object):
             return True
         return False
 
-    def save_votes(self):
-        if self.round is not None:
+    async def save_votes(self, played_round, votes):
+        if played_round is not None:
             logger.info(
                 "#{} VOTES: +{} -{} by {}".format(
-                    self.round.id,
-                    self.votes["up"],
-                    self.votes["down"],
-                    ", ".join(self.votes["players"]),
+                    played_round.id,
+                    votes["up"],
+                    votes["down"],
+                    ", ".join(votes["players"]),
                 )
             )
-            with db_session():
-                q = Question[self.round.question.id]
-                q.set(
-                    vote_up=q.vote_up + self.votes["up"],
-                    vote_down=q.vote_down + self.votes["down"],
-                )
+
+            journal.question(
+                played_round.question.id, vote_up=votes["up"], vote_down=votes["down"]
+            )
+            self.questions.voted(played_round.question.id, votes["up"], votes["down"])
@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WordFilter(object):
+    """
+    Replace bad words in a single pass, this is a good place.
+
+    Every word form (stem with optional prefix and suffix) is expanded
+    into one lookup table, so the cost per message only depends on its
+    number of words, not on the size of the word list.
+
+    The word list is a JSON file mapping stems to their replacement and
+    allowed prefixes and suffixes. It's reloaded when it changes.
+
+    """
+
+    PATH = os.environ.get(
+        "GOOD_PLACE_FILE",
+        os.path.join(os.path.dirname(__file__), "..", "config", "good_place.json"),
+    )
+    RELOAD_INTERVAL = 5
+    WORD_RE = re.compile(r"\w+")
+
+    def __init__(self, path=None):
+        self.path = path or self.PATH
+        self.words = {}
+        self.mtime = None
+        self.checked = 0
+        self.reload()
+
+    @staticmethod
+    def expand(config):
+        """
+        Map every lowercase word form to (prefix length, stem length, replacement).
+
+        """
+        words = {}
+        for stem, options in config.items():
+            replace = options["replace"]
+            for prefix in [""] + options.get("prefixes", []):
+                for suffix in [""] + options.get("suffixes", []):
+                    form = "{}{}{}".format(prefix, stem, suffix).lower()
+                    words[form] = (len(prefix), len(stem), replace)
+        return words
+
+    def reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self.mtime:
+                return
+            with open(self.path) as f:
+                self.words = self.expand(json.load(f))
+            self.mtime = mtime
+            logger.info(
+                "Loaded {} word forms from {}".format(len(self.words), self.path)
+            )
+        except (OSError, ValueError, KeyError, AttributeError):
+            logger.exception("Could not load word list {}".format(self.path))
+
+    def _replace(self, match):
+        word = match.group()
+        form = self.words.get(word.lower())
+        if form is None:
+            return word
+        prefix, stem, replace = form
+        return word[:prefix] + replace + word[prefix + stem:]
+
+    def sub(self, text):
+        now = time.time()
+        if now - self.checked > self.RELOAD_INTERVAL:
+            self.checked = now
+            self.reload()
+        return self.WORD_RE.sub(self._replace, text)
+
+
+word_filter = WordFilter()
@@ -1,17 +1,111 @@
 import datetime
 import locale
 import os
+import threading
+from functools import lru_cache
 
 LOCALE = os.environ.get("LC_ALL", "en_US.UTF-8")
 
+_locale_lock = threading.Lock()
+
+
+class NumberFormat(object):
+    """
+    Formats numbers with the grouping and decimal separator of a locale.
+
+    The conventions are read once, formatting never touches the process
+    wide locale, which isn't thread safe and slow to switch.
+
+    """
+
+    __slots__ = ("decimal_point", "thousands_sep", "grouping", "translation")
+
+    def __init__(self, decimal_point=".", thousands_sep=",", grouping=(3, 0)):
+        self.decimal_point = decimal_point
+        self.thousands_sep = thousands_sep
+        self.grouping = list(grouping)
+        # Groups of three are formatted by str.format, separators replaced.
+        self.translation = None
+        if thousands_sep and self.grouping[:1] == [3] and self._repeats():
+            self.translation = str.maketrans({",": thousands_sep, ".": decimal_point})
+
+    def _repeats(self):
+        for size in self.grouping[1:]:
+            if size == 0:
+                return True
+            if size != 3:
+                return False
+        return True
+
+    @classmethod
+    def for_locale(cls, name):
+        """
+        Read the conventions of a locale, falls back to en_US if it's missing.
+
+        """
+        with _locale_lock:
+            previous = locale.setlocale(locale.LC_NUMERIC)
+            try:
+                locale.setlocale(locale.LC_NUMERIC, name)
+                conv = locale.localeconv()
+            except locale.Error:
+                return cls()
+            finally:
+                locale.setlocale(locale.LC_NUMERIC, previous)
+        return cls(conv["decimal_point"], conv["thousands_sep"], conv["grouping"])
+
+    def _group(self, digits):
+        if not self.thousands_sep or not self.grouping:
+            return digits
+        groups = []
+        size = None
+        for step in self.grouping:
+            if step == locale.CHAR_MAX:
+                break
+            if step != 0:
+                size = step
+            if len(digits) <= size:
+                break
+            groups.append(digits[-size:])
+            digits = digits[:-size]
+            if step == 0:
+                # repeat the last size for the rest
+                while len(digits) > size:
+                    groups.append(digits[-size:])
+                    digits = digits[:-size]
+                break
+        groups.append(digits)
+        return self.thousands_sep.join(reversed(groups))
+
+    def format(self, num, decimal_places=0):
+        if decimal_places > 0 and isinstance(num, float):
+            if self.translation is not None:
+                return "{:,.{}f}".format(num, decimal_places).translate(
+                    self.translation
+                )
+            text = "{:.{}f}".format(num, decimal_places)
+        else:
+            if self.translation is not None:
+                return "{:,d}".format(int(num)).translate(self.translation)
+            text = "{:d}".format(int(num))
+
+        sign = "-" if text.startswith("-") else ""
+        integer, _, fraction = text.lstrip("-").partition(".")
+        text = sign + self._group(integer)
+        if fraction:
+            text += self.decimal_point + fraction
+        return text
+
+
+@lru_cache(maxsize=None)
+def get_number_format(name):
+    return NumberFormat.for_locale(name)
+
 
 def format_number(num, decimal_places=0):
     if not isinstance(num, (int, float)):
         return "n/a"
-    locale.setlocale(locale.LC_ALL, LOCALE)
-    if decimal_places > 0 and isinstance(num, float):
-        return locale.format("%.{}f".format(decimal_places), num, grouping=True)
-    return locale.format("%d", num, grouping=True)
+    return get_number_format(LOCALE).format(num, decimal_places)
 
 
 def pluralize(s, p):
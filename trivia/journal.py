@@ -0,0 +1,251 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from .executor import database
+from .models import JournalBatch, db
+
+logger = logging.getLogger(__name__)
+
+
+def _timestamp(dt):
+    return dt.isoformat() if dt is not None else None
+
+
+def _datetime(value):
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+class WriteJournal(object):
+    """
+    Write-behind journal for round results, daily score rollups and
+    question counters.
+
+    Game writes are collected in memory and applied in one transaction
+    of batched ``UPDATE ... SET x = x + n`` statements, at round ends
+    and every few seconds.
+
+    Every write is appended to a local journal file before it is
+    queued. A batch's file is only removed after its transaction has
+    committed, together with a ``JournalBatch`` row that makes replaying
+    it after a crash idempotent.
+
+    """
+
+    PATH = os.environ.get("JOURNAL_PATH", "/tmp/triviaroyale.journal")
+    FLUSH_INTERVAL = float(os.environ.get("JOURNAL_FLUSH_INTERVAL", 5.0))
+    KEEP_BATCHES = timedelta(days=1)
+
+    QUESTION_SQL = """
+        UPDATE question SET
+            times_played = times_played + $times_played,
+            times_solved = times_solved + $times_solved,
+            vote_up = vote_up + $vote_up,
+            vote_down = vote_down + $vote_down,
+            last_played = GREATEST(last_played, COALESCE($last_played, last_played))
+        WHERE id = $id
+    """
+    ROUND_SQL = """
+        UPDATE round SET
+            solved = $solved,
+            solver = $solver,
+            points = $points,
+            time_taken = $time_taken,
+            start_time = $start_time
+        WHERE id = $id
+    """
+    SCORE_SQL = """
+        INSERT INTO playerdailyscore (player, day, points, rounds)
+        VALUES ($player, $day, $points, $rounds)
+        ON CONFLICT (player, day) DO UPDATE SET
+            points = playerdailyscore.points + EXCLUDED.points,
+            rounds = playerdailyscore.rounds + EXCLUDED.rounds
+    """
+    PLAYER_SQL = """
+        UPDATE player SET last_played = GREATEST(last_played, $last_played)
+        WHERE id = $id
+    """
+
+    def __init__(self, path=None):
+        self.path = path or self.PATH
+        self.fd = None
+        self.entries = []
+        self.segments = []
+        self.lock = asyncio.Lock()
+
+    def _open(self):
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+
+    def record(self, entry):
+        """
+        Queue a write. It's in the journal file once this returns.
+
+        """
+        self._open()
+        os.write(self.fd, json.dumps(entry).encode() + b"\n")
+        self.entries.append(entry)
+
+    def round(self, round_id, start_time, solver=None, points=0, time_taken=None):
+        self.record(
+            {
+                "op": "round",
+                "id": round_id,
+                "solved": solver is not None,
+                "solver": solver,
+                "points": points,
+                "time_taken": time_taken,
+                "start_time": _timestamp(start_time),
+            }
+        )
+
+    def question(
+        self,
+        question_id,
+        times_played=0,
+        times_solved=0,
+        vote_up=0,
+        vote_down=0,
+        last_played=None,
+    ):
+        self.record(
+            {
+                "op": "question",
+                "id": question_id,
+                "times_played": times_played,
+                "times_solved": times_solved,
+                "vote_up": vote_up,
+                "vote_down": vote_down,
+                "last_played": _timestamp(last_played),
+            }
+        )
+
+    def player(self, player_id, last_played):
+        self.record(
+            {"op": "player", "id": player_id, "last_played": _timestamp(last_played)}
+        )
+
+    def _rotate(self):
+        """
+        Close the current journal file as a batch segment.
+
+        """
+        segment = "{}.{}".format(self.path, uuid.uuid4())
+        if self.fd is not None:
+            os.fsync(self.fd)
+            os.close(self.fd)
+            self.fd = None
+        if os.path.exists(self.path):
+            os.rename(self.path, segment)
+        return segment
+
+    async def flush(self):
+        async with self.lock:
+            if self.entries:
+                self.segments.append((self._rotate(), self.entries))
+                self.entries = []
+            # batches that failed before are retried first
+            while self.segments:
+                segment, entries = self.segments[0]
+                try:
+                    await database.run(self.apply, segment, entries)
+                except Exception:
+                    logger.exception("Journal: flush failed, will retry")
+                    return
+                os.unlink(segment)
+                self.segments.pop(0)
+                logger.debug("Journal: flushed {} writes".format(len(entries)))
+
+    async def replay(self):
+        """
+        Apply journal files left behind by a previous process.
+
+        """
+        async with self.lock:
+            self._rotate()
+            for segment in sorted(glob.glob("{}.*".format(self.path))):
+                with open(segment) as f:
+                    entries = [json.loads(line) for line in f if line.strip()]
+                await database.run(self.apply, segment, entries)
+                os.unlink(segment)
+                logger.info(
+                    "Journal: replayed {} writes from {}".format(len(entries), segment)
+                )
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+            await self.flush()
+
+    @classmethod
+    def merge(cls, entries):
+        """
+        Combine writes to the same rows into one update each.
+
+        """
+        questions, rounds, players = {}, {}, {}
+        for entry in entries:
+            op, key = entry["op"], entry["id"]
+            if op == "round":
+                rounds[key] = entry
+            elif op == "question":
+                merged = questions.setdefault(
+                    key,
+                    {
+                        "id": key,
+                        "times_played": 0,
+                        "times_solved": 0,
+                        "vote_up": 0,
+                        "vote_down": 0,
+                        "last_played": None,
+                    },
+                )
+                for field in ("times_played", "times_solved", "vote_up", "vote_down"):
+                    merged[field] += entry[field]
+                if entry["last_played"] is not None:
+                    merged["last_played"] = max(
+                        merged["last_played"] or "", entry["last_played"]
+                    )
+            elif op == "player":
+                players[key] = max(players.get(key, ""), entry["last_played"])
+        return questions.values(), rounds.values(), players.items()
+
+    @classmethod
+    def apply(cls, segment, entries):
+        """
+        Apply a batch within the caller's db_session, once.
+
+        """
+        batch_id = os.path.basename(segment).rsplit(".", 1)[-1]
+        if JournalBatch.exists(id=batch_id):
+            return
+
+        questions, rounds, players = cls.merge(entries)
+        for q in questions:
+            q["last_played"] = _datetime(q["last_played"])
+            db.execute(cls.QUESTION_SQL, {}, q)
+        scores = {}
+        for r in rounds:
+            r = dict(r, start_time=_datetime(r["start_time"]))
+            db.execute(cls.ROUND_SQL, {}, r)
+            if r["solver"] is not None:
+                key = (r["solver"], r["start_time"].date())
+                points, count = scores.get(key, (0, 0))
+                scores[key] = (points + r["points"], count + 1)
+        for (player_id, day), (points, count) in scores.items():
+            params = {"player": player_id, "day": day, "points": points, "rounds": count}
+            db.execute(cls.SCORE_SQL, {}, params)
+        for player_id, last_played in players:
+            params = {"id": player_id, "last_played": _datetime(last_played)}
+            db.execute(cls.PLAYER_SQL, {}, params)
+
+        JournalBatch(id=batch_id)
+        cutoff = datetime.utcnow() - cls.KEEP_BATCHES
+        JournalBatch.select(lambda b: b.created < cutoff).delete(bulk=True)
+
+
+journal = WriteJournal()
@@ -2,23 +2,23 @@ import math
 import os
 import re
 from collections import OrderedDict
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 from passlib.hash import bcrypt_sha256
 from pony.orm import commit  # NOQA
 from pony.orm import (
     Database,
     Optional,
+    PrimaryKey,
     Required,
     Set,
-    avg,
-    count,
+    composite_index,
     db_session,
-    get,
     select,
     sql_debug,
 )
 
+from trivia.answers import AnswerMatcher
 from trivia.helpers import get_week_tuple
 
 db = Database()
@@ -46,14 +46,6 @@ class Question(db.Entity):
 
     """
 
-    GET_RANDOM_SQL = """
-        SELECT * FROM question
-        WHERE active = true
-        AND last_played < $round_start
-        AND (vote_up - vote_down) > $min_rating
-        ORDER BY RANDOM() * (GREATEST(times_solved, 1) / (SELECT SUM(times_solved)+1 FROM question)::float)
-        LIMIT 100
-    """
     MIN_POINTS = 100
     BASE_POINTS = 500
     MIN_RATING = -3  # Questions with lower rating will not be played
@@ -64,6 +56,11 @@ class Question(db.Entity):
 
     MASK_CHAR = "_"
     COMMON_WORDS = ["the", "a", "an", "and", "of"]
+    # skip double vowels
+    VOWEL_RE = re.compile(r"(?:\b|[^aeiou])([aeiou])", re.I)
+    CONSONANT_RE = re.compile(r"([^aeiou])", re.I)
+    NON_LETTER_RE = re.compile(r"[^A-Za-z]")
+    WORD_RE = re.compile(r"\w{2,}")
 
     active = Required(bool, default=False)
 
@@ -96,21 +93,12 @@ class Question(db.Entity):
         return self.answer.split("|")[0]
 
     @property
-    def answer_re(self):
-        if not hasattr(self, "_answer_re"):
-            answers = map(lambda a: re.escape(a), self.answer.split("|"))
-            pattern = r"\b{}\b".format("|".join(answers))
-            self._answer_re = re.compile(pattern, re.IGNORECASE)
-        return self._answer_re
+    def answer_matcher(self):
+        return AnswerMatcher(self.answer.split("|"), self.COMMON_WORDS)
 
     @property
     def category_names(self):
-        if not hasattr(self, "_category_names"):
-            with db_session():
-                self._category_names = ", ".join(
-                    [c.name for c in self.categories.order_by(Category.name)]
-                )
-        return self._category_names
+        return ", ".join([c.name for c in self.categories.order_by(Category.name)])
 
     @property
     def solve_percentage(self):
@@ -119,7 +107,7 @@ class Question(db.Entity):
         return self.times_solved / self.times_played * 100
 
     def check_answer(self, answer):
-        return self.answer_re.search(answer) is not None
+        return self.answer_matcher.match(answer)
 
     def _mask_word(self, word, vowels_fn=None, consonants_fn=None):
         if word.lower() in self.COMMON_WORDS:
@@ -132,9 +120,7 @@ class Question(db.Entity):
         consonants = consonants_fn(word_len)
 
         if vowels:
-            # skip double vowels
-            r = re.compile(r"(?:\b|[^aeiou])([aeiou])", re.I)
-            for i, match in enumerate(r.finditer(word)):
+            for i, match in enumerate(self.VOWEL_RE.finditer(word)):
                 masked_word[match.end() - 1] = match.group(1)
                 if i + 1 >= vowels:
                     break
@@ -143,8 +129,7 @@ class Question(db.Entity):
                 consonants += 1
 
         if consonants:
-            r = re.compile(r"([^aeiou])", re.I)
-            for i, match in enumerate(r.finditer(word)):
+            for i, match in enumerate(self.CONSONANT_RE.finditer(word)):
                 masked_word[match.end() - 1] = match.group(1)
                 if i + 1 >= consonants or word_len < 4:
                     break
@@ -159,10 +144,10 @@ class Question(db.Entity):
         """
         answer = self.primary_answer
 
-        if num == 1 and not re.search(r"[^A-Za-z]", answer):
+        if num == 1 and not self.NON_LETTER_RE.search(answer):
             return "{} letters".format(len(answer))
 
-        words = re.compile(r"\w{2,}").findall(answer)
+        words = self.WORD_RE.findall(answer)
 
         def _letters(hint_num, consonants=False):
             base = hint_num - (1 if consonants else 0)
@@ -176,6 +161,22 @@ class Question(db.Entity):
             hint = hint.replace(word, self._mask_word(word, vowels, consonants))
         return "<kbd>{}</kbd>".format(hint)
 
+    def prepare(self, hint_max):
+        """
+        Compute everything a round needs from this question, the returned
+        PreparedQuestion can be used outside of a db_session.
+
+        """
+        return PreparedQuestion(
+            id=self.id,
+            question=self.question,
+            media_url=self.media_url,
+            answer=self.primary_answer,
+            categories=self.category_names,
+            hints=tuple(self.get_hint(num) for num in range(1, hint_max + 1)),
+            matcher=self.answer_matcher,
+        )
+
     def calculate_points(self, time_percentage, hints=0, streak=1):
         """
         Calculate how many points answering this question got someone.
@@ -215,6 +216,68 @@ class Question(db.Entity):
         return points + bonus_points
 
 
+class PreparedQuestion(object):
+    """
+    The question of a round, with its hints and answer matcher built.
+
+    """
+
+    __slots__ = (
+        "id",
+        "question",
+        "media_url",
+        "answer",
+        "categories",
+        "hints",
+        "matcher",
+    )
+
+    def __init__(self, id, question, media_url, answer, categories, hints, matcher):
+        self.id = id
+        self.question = question
+        self.media_url = media_url
+        self.answer = answer
+        self.categories = categories
+        self.hints = hints
+        self.matcher = matcher
+
+    def __str__(self):
+        return "{} *** {}".format(self.question, self.answer)
+
+    def check_answer(self, text):
+        return self.matcher.match(text)
+
+
+STATS_PERIODS = ["day", "week", "month", "year"]
+STATS_AGGREGATES = [
+    "COALESCE(SUM(points) FILTER (WHERE {where}), 0)",
+    "COUNT(*) FILTER (WHERE {where})",
+    "CAST(AVG(points) FILTER (WHERE {where}) AS DOUBLE PRECISION)",
+    "MAX(points) FILTER (WHERE {where})",
+    "AVG(time_taken) FILTER (WHERE {where})",
+    "MIN(time_taken) FILTER (WHERE {where})",
+]
+
+
+def _stats_sql():
+    columns = []
+    for period in STATS_PERIODS:
+        where = "start_time >= ${0}_start AND start_time < ${0}_end".format(period)
+        columns += [aggregate.format(where=where) for aggregate in STATS_AGGREGATES]
+    return (
+        "SELECT {} FROM round "
+        "WHERE solver = $player AND start_time >= $start AND start_time < $end"
+    ).format(", ".join(columns))
+
+
+def _midnight(day):
+    return datetime(day.year, day.month, day.day)
+
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
 class Player(db.Entity):
     """
     A player.
@@ -222,6 +285,33 @@ class Player(db.Entity):
     """
 
     NAME_MAX_LEN = 30
+    STATS_SQL = _stats_sql()
+    # Name lookups go through lower(name): a C collated btree for prefixes,
+    # which also yields them in order, and a trigram index for the rest.
+    SEARCH_INDEXES_SQL = [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS idx_player__name_prefix "
+        'ON player ((lower(name) COLLATE "C"))',
+        "CREATE INDEX IF NOT EXISTS idx_player__name_trgm "
+        "ON player USING gin (lower(name) gin_trgm_ops)",
+    ]
+    COMPLETE_SQL = """
+        SELECT name FROM player
+        WHERE lower(name) COLLATE "C" LIKE $pattern
+        ORDER BY lower(name) COLLATE "C"
+        LIMIT $limit
+    """.strip()
+    SEARCH_SQL = """
+        SELECT * FROM player
+        WHERE lower(name) LIKE $pattern
+        ORDER BY lower(name) NOT LIKE $prefix, length(name), lower(name)
+        LIMIT $limit
+    """.strip()
+    RECENT_ROUNDS_SQL = """
+        SELECT start_time, points FROM round
+        WHERE solver = $player AND start_time >= $start
+        ORDER BY start_time
+    """.strip()
     BCRYPT_ROUNDS = 11
     PERMISSIONS = [
         "__EVERYTHING__",
@@ -240,14 +330,44 @@ class Player(db.Entity):
     last_played = Required(datetime, sql_default="CURRENT_TIMESTAMP")
 
     rounds_solved = Set("Round")
+    daily_scores = Set("PlayerDailyScore")
     submitted_reports = Set("Report")
     submitted_questions = Set(Question)
 
     def __str__(self):
         return "{} (#{})".format(self.name, self.id)
 
-    def logged_in(self):
-        self.last_played = datetime.utcnow()
+    @staticmethod
+    def _like(text):
+        return re.sub(r"([\\%_])", r"\\\1", text.lower())
+
+    @classmethod
+    def complete(cls, prefix, limit=10):
+        """
+        Names starting with prefix, ignoring case, in alphabetical order.
+
+        """
+        params = {"pattern": cls._like(prefix) + "%", "limit": limit}
+        return db.select(cls.COMPLETE_SQL, {}, params)
+
+    @classmethod
+    def search(cls, name, limit=6):
+        """
+        Players with name in their name, ignoring case, prefix matches first.
+
+        """
+        pattern = cls._like(name)
+        params = {
+            "pattern": "%" + pattern + "%",
+            "prefix": pattern + "%",
+            "limit": limit,
+        }
+        return cls.select_by_sql(cls.SEARCH_SQL, {}, params)
+
+    @classmethod
+    def create_search_indexes(cls):
+        for sql in cls.SEARCH_INDEXES_SQL:
+            db.execute(sql)
 
     def has_password(self):
         return bool(self.password_hash)
@@ -283,6 +403,30 @@ class Player(db.Entity):
             return False
         return 1 & self.permissions or perm & self.permissions
 
+    def get_stats_params(self, dt):
+        """
+        Parameters of ``STATS_SQL`` for the periods around the date ``dt``.
+
+        """
+        dt_week = get_week_tuple(dt)
+        dt_month = dt.replace(day=1)
+        dt_year = dt.replace(month=1, day=1)
+
+        # half-open [start, end) ranges, so the (solver, start_time) index is used
+        ranges = {
+            "day": (dt, dt + timedelta(days=1)),
+            "week": (dt_week[0], dt_week[1] + timedelta(days=1)),
+            "month": (dt_month, _next_month(dt_month)),
+            "year": (dt_year, dt_year.replace(year=dt.year + 1)),
+        }
+        params = {"player": self.id}
+        for period, (start, end) in ranges.items():
+            params[period + "_start"] = _midnight(start)
+            params[period + "_end"] = _midnight(end)
+        params["start"] = min(_midnight(start) for start, end in ranges.values())
+        params["end"] = max(_midnight(end) for start, end in ranges.values())
+        return params
+
     @db_session
     def get_stats(self, dt=None):
         if dt is None:
@@ -292,71 +436,33 @@ class Player(db.Entity):
         dt_month = dt.replace(day=1)
         dt_year = dt.replace(month=1, day=1)
 
-        q = select(
-            (
-                sum(r.points),
-                count(r),
-                avg(r.points),
-                max(r.points),
-                avg(r.time_taken),
-                min(r.time_taken),
-            )
-            for r in Round
-            if r.solver == self
-        )
-
-        r = datetime.utcnow()  # dummy for use in lambdas below
-        day = q.filter(lambda: r.start_time.date() == dt).get()
-        week = q.filter(
-            lambda: r.start_time.date() >= dt_week[0]
-            and r.start_time.date() <= dt_week[1]
-        ).get()
-        month = q.filter(
-            lambda: r.start_time.year == dt.year and r.start_time.month == dt.month
-        ).get()
-        year = q.filter(lambda: r.start_time.year == dt.year).get()
+        row = db.select(self.STATS_SQL, {}, self.get_stats_params(dt))[0]
+        size = len(STATS_AGGREGATES)
+        values = {
+            period: tuple(row[i * size:(i + 1) * size])
+            for i, period in enumerate(STATS_PERIODS)
+        }
 
         return OrderedDict(
             [
-                ("day", (dt, day)),
-                ("week", (dt_week, week)),
-                ("month", (dt_month, month)),
-                ("year", (dt_year, year)),
+                ("day", (dt, values["day"])),
+                ("week", (dt_week, values["week"])),
+                ("month", (dt_month, values["month"])),
+                ("year", (dt_year, values["year"])),
             ]
         )
 
     @db_session
-    def get_recent_scores(self):
+    def get_recent_rounds(self):
         """
-        Get this player's most recent scores.
+        Get start time and points of this player's rounds since the last
+        hour or midnight, whichever is earlier, to seed the score windows.
 
         """
         now = datetime.utcnow()
-
-        stats = get(
-            (
-                # Last 60 minutes
-                sum(
-                    r.points
-                    for r in Round
-                    if r.solver == self and r.start_time > now - timedelta(hours=1)
-                ),
-                count(r.solver == self and r.start_time > now - timedelta(hours=1)),
-                # This day
-                sum(
-                    r.points
-                    for r in Round
-                    if r.solver == self and r.start_time.date() == now.date()
-                ),
-                count(r.solver == self and r.start_time.date() == now.date()),
-            )
-            for r in Round
-        )
-
-        return {
-            "points-1h": "{} ({})".format(stats[0], stats[1]),
-            "points-day": "{} ({})".format(stats[2], stats[3]),
-        }
+        start = min(now - timedelta(hours=1), _midnight(now.date()))
+        params = {"player": self.id, "start": start}
+        return db.select(self.RECENT_ROUNDS_SQL, {}, params)
 
 
 class Round(db.Entity):
@@ -372,37 +478,70 @@ class Round(db.Entity):
     solver = Optional(Player)
     time_taken = Optional(float)
     points = Required(int, default=0)
+    composite_index(solver, start_time)
 
     @classmethod
-    def new(cls, round_start):
+    def new(cls, question_id):
         """
-        Select a new random question for a new round.
+        Start a new round with the question picked by the question pool.
 
         """
-        min_rating = Question.MIN_RATING  # NOQA locals passed to select_by_sql
-        question = Question.select_by_sql(Question.GET_RANDOM_SQL)[0]
-        return cls(question=question)
+        return cls(question=Question[question_id])
 
-    @db_session
-    def solved_by(self, player, total_time, hints=0, streak=1):
-        self.solved = True
-        self.solver = player
-        self.time_taken = datetime.utcnow().timestamp() - self.start_time.timestamp()
-        self.points = self.question.calculate_points(
-            self.time_taken / total_time, hints, streak
-        )
+    @classmethod
+    def last_solved_id(cls):
+        """
+        Id of the latest solved round, it changes whenever scores do.
 
-    @db_session
-    def end_round(self):
         """
-        Update the question statistics after a round.
+        return select(r.id for r in cls if r.solved).max()
+
+
+class PlayerDailyScore(db.Entity):
+    """
+    Points and solved rounds of a player per day, for highscores.
+
+    Kept up to date by the write journal, see ``WriteJournal.SCORE_SQL``.
+
+    """
+
+    player = Required(Player)
+    day = Required(date)
+    points = Required(int, default=0)
+    rounds = Required(int, default=0)
+    PrimaryKey(player, day)
+
+    BACKFILL_SQL = """
+        INSERT INTO playerdailyscore (player, day, points, rounds)
+        SELECT solver, CAST(start_time AS DATE), SUM(points), COUNT(*) FROM round
+        WHERE solved = true AND solver IS NOT NULL
+        GROUP BY solver, CAST(start_time AS DATE)
+    """
+
+    @classmethod
+    def highscores(cls, start=None, end=None, limit=10):
+        """
+        Top players by points between two days, inclusive.
 
         """
-        self.question.set(
-            last_played=datetime.utcnow(), times_played=self.question.times_played + 1
-        )
-        if self.solved:
-            self.question.set(times_solved=self.question.times_solved + 1)
+        if start is None:
+            scores = select((s.player, sum(s.points), sum(s.rounds)) for s in cls)
+        else:
+            scores = select(
+                (s.player, sum(s.points), sum(s.rounds))
+                for s in cls
+                if s.day >= start and s.day <= end
+            )
+        return scores.order_by(-2)[:limit]
+
+    @classmethod
+    def backfill(cls):
+        """
+        Rebuild all rollups from round history.
+
+        """
+        cls.select().delete(bulk=True)
+        db.execute(cls.BACKFILL_SQL.strip())
 
 
 class Report(db.Entity):
@@ -416,3 +555,13 @@ class Report(db.Entity):
     text = Required(str)
     created = Required(datetime, sql_default="CURRENT_TIMESTAMP")
     done = Required(bool, default=False)
+
+
+class JournalBatch(db.Entity):
+    """
+    A write journal batch that has been applied to the database.
+
+    """
+
+    id = PrimaryKey(str, 40)
+    created = Required(datetime, sql_default="CURRENT_TIMESTAMP")
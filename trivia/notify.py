@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class NullTransport(object):
+    """
+    Drops notifications, used when nothing is configured.
+
+    """
+
+    async def send(self, message):
+        pass
+
+
+class FileTransport(object):
+    """
+    Append notifications to a local file, for testing.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _write(self, message):
+        with open(self.path, "a") as f:
+            f.write("{} {}\n".format(int(time.time()), message))
+
+    async def send(self, message):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._write, message)
+
+
+class PushoverTransport(object):
+    """
+    Send notifications with Pushover, or a local HTTP stub at ``PUSHOVER_URL``.
+
+    """
+
+    URL = os.environ.get("PUSHOVER_URL", "https://api.pushover.net/1/messages.json")
+
+    def __init__(self, app_token, user_token, url=None, timeout=10):
+        self.app_token = app_token
+        self.user_token = user_token
+        self.url = url or self.URL
+        self.timeout = timeout
+
+    def _post(self, message):
+        response = requests.post(
+            self.url,
+            data={"token": self.app_token, "user": self.user_token, "message": message},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+
+    async def send(self, message):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._post, message)
+
+
+def get_transport():
+    path = os.environ.get("NOTIFY_FILE")
+    if path:
+        return FileTransport(path)
+    app_token = os.environ.get("PUSHOVER_APP_TOKEN")
+    user_token = os.environ.get("PUSHOVER_USER_TOKEN")
+    if app_token and user_token:
+        return PushoverTransport(app_token, user_token)
+    return NullTransport()
+
+
+class Notifier(object):
+    """
+    Admin notifications, sent in the background.
+
+    Queuing never waits. Players coming online within ``INTERVAL`` of the
+    last notification are coalesced into the next one, failed sends are
+    retried with exponential backoff.
+
+    """
+
+    INTERVAL = int(os.environ.get("NOTIFY_INTERVAL", 60 * 15))  # 15 minutes
+    MAX_QUEUE = 100
+    TIMEOUT = 15
+    RETRIES = 5
+    BACKOFF = 2.0
+    BACKOFF_MAX = 300.0
+    NAMES_SHOWN = 3
+
+    def __init__(self, transport=None):
+        self.transport = transport or get_transport()
+        self.queue = asyncio.Queue(self.MAX_QUEUE)
+        self.dropped = 0
+
+    def player_online(self, name):
+        if os.getenv("ADMIN_NICK", None) == name:
+            return
+        try:
+            self.queue.put_nowait(name)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def _collect(self, first):
+        names = [first]
+        while not self.queue.empty():
+            name = self.queue.get_nowait()
+            if name not in names:
+                names.append(name)
+        dropped, self.dropped = self.dropped, 0
+        return names, len(names) + dropped
+
+    @classmethod
+    def format(cls, names, count):
+        if count == 1:
+            return "Player {} is now online!".format(names[0])
+        shown = ", ".join(names[: cls.NAMES_SHOWN])
+        if count > cls.NAMES_SHOWN:
+            shown += " and {} more".format(count - cls.NAMES_SHOWN)
+        return "{} players came online: {}".format(count, shown)
+
+    async def deliver(self, message):
+        for attempt in range(self.RETRIES):
+            try:
+                await asyncio.wait_for(self.transport.send(message), self.TIMEOUT)
+            except Exception as e:
+                delay = min(self.BACKOFF * 2 ** attempt, self.BACKOFF_MAX)
+                logger.warn(
+                    "Notification failed ({}), retrying in {}s: {}".format(
+                        e, delay, message
+                    )
+                )
+                await asyncio.sleep(delay)
+            else:
+                logger.info("Notified admin: {}".format(message))
+                return
+        logger.warn("Notification dropped: {}".format(message))
+
+    async def run(self):
+        while True:
+            names, count = self._collect(await self.queue.get())
+            await self.deliver(self.format(names, count))
+            await asyncio.sleep(self.INTERVAL)
+
+
+notifier = Notifier()
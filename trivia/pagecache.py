@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict
+
+try:
+    import uwsgi
+except ImportError:
+    uwsgi = None
+
+
+class PageCache(object):
+    """
+    Rendered pages by key, bounded to the ``size`` most recently used.
+
+    Under uWSGI with a cache called ``name`` configured (see
+    config/uwsgi.ini) the pages are shared by all workers, otherwise
+    every process keeps its own.
+
+    """
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self.pages = OrderedDict()
+        self.shared = uwsgi is not None and name in self._uwsgi_caches()
+
+    @staticmethod
+    def _uwsgi_caches():
+        caches = uwsgi.opt.get("cache2", [])
+        if not isinstance(caches, list):
+            caches = [caches]
+        names = []
+        for cache in caches:
+            if isinstance(cache, bytes):
+                cache = cache.decode()
+            options = dict(option.split("=", 1) for option in cache.split(","))
+            names.append(options.get("name"))
+        return names
+
+    def get(self, key):
+        if self.shared:
+            return uwsgi.cache_get(key, self.name)
+
+        entry = self.pages.get(key)
+        if entry is None:
+            return None
+        body, expires = entry
+        if expires and expires < time.monotonic():
+            del self.pages[key]
+            return None
+        self.pages.move_to_end(key)
+        return body
+
+    def set(self, key, body, ttl=0):
+        """
+        Store a page for ``ttl`` seconds, or until it's evicted if 0.
+
+        """
+        if self.shared:
+            # too large pages are simply not cached
+            uwsgi.cache_update(key, body, ttl, self.name)
+            return
+
+        self.pages[key] = (body, time.monotonic() + ttl if ttl else 0)
+        self.pages.move_to_end(key)
+        while len(self.pages) > self.size:
+            self.pages.popitem(last=False)
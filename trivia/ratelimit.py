@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket(object):
+    """
+    Allows ``rate`` actions per second on average, bursts up to ``burst``.
+
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class Inbox(object):
+    """
+    Inbound messages of a single connection.
+
+    Messages are checked against a token bucket per kind and queued for
+    one worker task, which handles them in order. Messages over the
+    limit or beyond a full queue are dropped, the client is told so
+    at most every ``NOTICE_INTERVAL`` seconds.
+
+    """
+
+    LIMITS = {
+        # kind: (messages per second, burst)
+        "chat": (2.0, 5),
+        "command": (1.0, 5),
+        "ping": (0.5, 3),
+    }
+    MAX_PENDING = 10
+    NOTICE_INTERVAL = 5.0
+    NOTICE = "You are sending too fast, some of your messages were dropped."
+
+    def __init__(self, ws, handle, notify):
+        self.ws = ws
+        self.handle = handle
+        self.notify = notify
+        self.buckets = {
+            kind: TokenBucket(rate, burst) for kind, (rate, burst) in self.LIMITS.items()
+        }
+        self.queue = asyncio.Queue(self.MAX_PENDING)
+        self.dropped = 0
+        self.noticed = 0
+        self.worker = asyncio.ensure_future(self.run())
+
+    @staticmethod
+    def kind(data):
+        if "command" in data:
+            return "command"
+        if "text" in data:
+            return "chat"
+        return "ping"
+
+    def put(self, data):
+        """
+        Queue a decoded message, returns False if it was dropped.
+
+        """
+        if self.buckets[self.kind(data)].take():
+            try:
+                self.queue.put_nowait(data)
+                return True
+            except asyncio.QueueFull:
+                pass
+        self.drop()
+        return False
+
+    def drop(self):
+        self.dropped += 1
+        now = time.monotonic()
+        if now - self.noticed > self.NOTICE_INTERVAL:
+            self.noticed = now
+            logger.warn(
+                "Rate limited {}: {} messages dropped".format(self.ws, self.dropped)
+            )
+            self.notify(self.ws, {"system": self.NOTICE})
+
+    async def run(self):
+        while True:
+            data = await self.queue.get()
+            try:
+                result = self.handle(self.ws, data)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception:
+                logger.exception("Error handling message: {}".format(data))
+
+    def close(self):
+        self.worker.cancel()
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import os
+import re
+
+from trivia.chat import GameController
+from trivia.game import TriviaGame
+
+logger = logging.getLogger(__name__)
+
+
+class Room(object):
+    """
+    A single game room with its own trivia game, players and chat.
+
+    """
+
+    def __init__(self, name, fanout):
+        self.name = name
+        self.fanout = fanout
+
+        self.game = GameController()
+        self.trivia = TriviaGame(self.broadcast, self.send)
+        self.game.trivia = self.trivia
+        self.game.send = self.send
+        self.game.broadcast = self.broadcast
+
+        asyncio.ensure_future(self.trivia.run())
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def clients(self):
+        return self.game.clients
+
+    def is_idle(self):
+        return not self.game.clients and self.trivia.state in (
+            TriviaGame.STATE_IDLE,
+            TriviaGame.STATE_LOCKED,
+        )
+
+    def close(self):
+        self.trivia.close()
+
+    async def send(self, ws, message, key=None):
+        self.fanout.send(ws, message, key)
+
+    async def broadcast(self, message, key=None):
+        self.fanout.broadcast(self.game.clients, message, key)
+
+
+class Rooms(object):
+    """
+    All game rooms of this server, sharing one event loop and database.
+
+    Clients pick a room with the websocket path (``/<room>``) or
+    switch rooms with the ``join`` command.
+
+    """
+
+    DEFAULT = "lobby"
+    MAX_ROOMS = int(os.environ.get("MAX_ROOMS", 20))
+    NAME_RE = re.compile(r"^[a-z0-9][a-z0-9-]{0,19}$")
+
+    def __init__(self, fanout):
+        self.fanout = fanout
+        self.rooms = {}
+        self.client_rooms = {}
+
+    def __iter__(self):
+        return iter(list(self.rooms.values()))
+
+    def clients(self):
+        return self.client_rooms.keys()
+
+    def room_name(self, path):
+        name = (path or "").split("?", 1)[0].strip("/").lower()
+        return name or self.DEFAULT
+
+    def get(self, name):
+        """
+        Get a room by name, opening it if there is capacity left.
+
+        """
+        if name in self.rooms:
+            return self.rooms[name]
+        if not self.NAME_RE.match(name):
+            return None
+        if len(self.rooms) >= self.MAX_ROOMS:
+            self._close_idle()
+        if len(self.rooms) >= self.MAX_ROOMS:
+            logger.warn("Room limit reached, not opening: {}".format(name))
+            return None
+
+        room = Room(name, self.fanout)
+        self.rooms[name] = room
+        logger.info("Room: opened {} ({} rooms)".format(name, len(self.rooms)))
+        return room
+
+    def _close_idle(self):
+        for name, room in list(self.rooms.items()):
+            if name != self.DEFAULT and room.is_idle():
+                room.close()
+                del self.rooms[name]
+                logger.info("Room: closed {}".format(name))
+
+    def of(self, ws):
+        return self.client_rooms.get(ws)
+
+    def enter(self, ws, path):
+        room = self.get(self.room_name(path))
+        if room is not None:
+            room.game.join(ws)
+            self.client_rooms[ws] = room
+        return room
+
+    def leave(self, ws):
+        room = self.client_rooms.pop(ws, None)
+        if room is not None:
+            room.game.leave(ws)
+        return room
+
+    def move(self, ws, name=None, *args, **kwargs):
+        """
+        Move a client to another room, keeping its login.
+
+        """
+        current = self.of(ws)
+        if name is None:
+            names = ", ".join(sorted(self.rooms.keys()))
+            asyncio.ensure_future(
+                current.send(
+                    ws,
+                    {
+                        "system": "You are in room *{}*. Open rooms: {}".format(
+                            current, names
+                        )
+                    },
+                )
+            )
+            return
+
+        room = self.get(str(name).lower())
+        if room is None:
+            asyncio.ensure_future(
+                current.send(ws, {"system": "Cannot join room: *{}*.".format(name)})
+            )
+            return
+        if room is current:
+            return
+
+        player = current.game.leave(ws)
+        room.game.join(ws)
+        self.client_rooms[ws] = room
+        asyncio.ensure_future(
+            room.send(ws, {"system": "You joined room *{}*.".format(room)})
+        )
+        if player is not None:
+            room.game.enter(ws, player)
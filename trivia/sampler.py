@@ -0,0 +1,160 @@
+import logging
+import random
+from array import array
+from datetime import datetime
+
+from .executor import database
+from .models import Question, db
+
+logger = logging.getLogger(__name__)
+
+
+class FenwickTree(object):
+    """
+    Binary indexed tree over non-negative weights.
+
+    Supports weight updates and weighted lookups in O(log n).
+
+    """
+
+    __slots__ = ("weights", "tree")
+
+    def __init__(self, weights):
+        size = len(weights)
+        self.weights = array("d", weights)
+        self.tree = array("d", [0.0]) * (size + 1)
+        for i, weight in enumerate(self.weights, 1):
+            self.tree[i] += weight
+            parent = i + (i & -i)
+            if parent <= size:
+                self.tree[parent] += self.tree[i]
+
+    def __len__(self):
+        return len(self.weights)
+
+    def total(self):
+        total, i = 0.0, len(self.weights)
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def set(self, pos, weight):
+        delta = weight - self.weights[pos]
+        if delta == 0:
+            return
+        self.weights[pos] = weight
+        i = pos + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, value):
+        """
+        Find the position whose cumulative weight range contains value.
+
+        """
+        pos, step = 0, 1 << len(self.weights).bit_length()
+        while step:
+            i = pos + step
+            if i < len(self.tree) and self.tree[i] <= value:
+                pos = i
+                value -= self.tree[i]
+            step >>= 1
+        # Rounding may land on a zero weight, fall back to a neighbour.
+        size = len(self.weights)
+        for i in range(min(pos, size - 1), -1, -1):
+            if self.weights[i] > 0:
+                return i
+        for i in range(pos, size):
+            if self.weights[i] > 0:
+                return i
+        raise IndexError("No questions left")
+
+
+class QuestionPool(object):
+    """
+    All active questions and their selection weights, kept in memory.
+
+    Like ``Question.GET_RANDOM_SQL`` used to, only questions with a rating
+    above ``Question.MIN_RATING`` that have not been played since the
+    round start are drawn, favouring the ones that were solved less often.
+
+    """
+
+    LOAD_SQL = """
+        SELECT id, times_solved, vote_up - vote_down, last_played FROM question
+        WHERE active = true
+    """
+
+    def __init__(self):
+        self.index = {}
+        self.ids = array("q")
+        self.solved = array("q")
+        self.rating = array("q")
+        self.last_played = array("d")
+        self.round_start = None
+        self.tree = FenwickTree([])
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def fetch(cls):
+        return db.select(cls.LOAD_SQL.strip())
+
+    async def load(self):
+        rows = await database.run(self.fetch)
+        self.index = {}
+        self.ids = array("q", (row[0] for row in rows))
+        self.solved = array("q", (row[1] for row in rows))
+        self.rating = array("q", (row[2] for row in rows))
+        self.last_played = array("d", (row[3].timestamp() for row in rows))
+        for pos, question_id in enumerate(self.ids):
+            self.index[question_id] = pos
+        self.reset()
+        logger.info("Loaded {} questions".format(len(self.ids)))
+
+    def _weight(self, pos):
+        if self.rating[pos] <= Question.MIN_RATING:
+            return 0.0
+        if self.round_start is not None and self.last_played[pos] >= self.round_start:
+            return 0.0
+        return 1.0 / max(self.solved[pos], 1)
+
+    def reset(self, round_start=None):
+        """
+        Recalculate all weights for questions not played since round_start.
+
+        """
+        if round_start is not None:
+            self.round_start = round_start.timestamp()
+        self.tree = FenwickTree([self._weight(pos) for pos in range(len(self.ids))])
+
+    def draw(self, round_start):
+        """
+        Pick a random question id, raises IndexError if none are left.
+
+        """
+        if round_start.timestamp() != self.round_start:
+            self.reset(round_start)
+        total = self.tree.total()
+        if total <= 0:
+            raise IndexError("No questions left")
+        return self.ids[self.tree.find(random.random() * total)]
+
+    def played(self, question_id, solved=False, when=None):
+        pos = self.index.get(question_id)
+        if pos is None:
+            return
+        self.last_played[pos] = (when or datetime.utcnow()).timestamp()
+        if solved:
+            self.solved[pos] += 1
+        self.tree.set(pos, self._weight(pos))
+
+    def voted(self, question_id, up=0, down=0):
+        pos = self.index.get(question_id)
+        if pos is None:
+            return
+        self.rating[pos] += up - down
+        self.tree.set(pos, self._weight(pos))
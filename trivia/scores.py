@@ -0,0 +1,110 @@
+from collections import deque
+from datetime import datetime, timedelta
+
+
+class RecentScores(object):
+    """
+    Points and rounds of a player in the last hour and today (UTC).
+
+    Rounds count by their start time, see Player.get_recent_rounds.
+
+    """
+
+    __slots__ = ("day", "day_points", "day_rounds", "hour", "hour_points", "touched")
+
+    HOUR = timedelta(hours=1)
+
+    def __init__(self, now):
+        self.day = now.date()
+        self.day_points = 0
+        self.day_rounds = 0
+        self.hour = deque()  # (start time, points), oldest first
+        self.hour_points = 0
+        self.touched = now
+
+    def _expire(self, now):
+        if now.date() != self.day:
+            self.day = now.date()
+            self.day_points = 0
+            self.day_rounds = 0
+        while self.hour and self.hour[0][0] < now - self.HOUR:
+            self.hour_points -= self.hour.popleft()[1]
+
+    def add(self, start_time, points, now):
+        self._expire(now)
+        self.touched = now
+        if start_time.date() == self.day:
+            self.day_points += points
+            self.day_rounds += 1
+        if start_time >= now - self.HOUR:
+            self.hour.append((start_time, points))
+            self.hour_points += points
+
+    def get(self, now):
+        self._expire(now)
+        return {
+            "points-1h": "{} ({})".format(self.hour_points, len(self.hour)),
+            "points-day": "{} ({})".format(self.day_points, self.day_rounds),
+        }
+
+
+class ScoreBoard(object):
+    """
+    Rolling score windows of the players on this server.
+
+    A player's windows are seeded from the database once, at login, and
+    updated as their rounds are scored, so the score panel needs no
+    query after a solve. Players without a round for an hour are
+    forgotten, everything they scored has long been flushed by then.
+
+    """
+
+    def __init__(self):
+        self.players = {}
+
+    def _prune(self, now):
+        for player_id, scores in list(self.players.items()):
+            if now - scores.touched > RecentScores.HOUR:
+                del self.players[player_id]
+
+    def seed(self, player_id, rounds):
+        """
+        Start tracking a player with their rounds since the last hour or
+        midnight, whichever is earlier, see Player.get_recent_rounds.
+
+        Returns the current scores, the windows already tracked win over
+        the rounds read from the database, which may miss unflushed ones.
+
+        """
+        now = datetime.utcnow()
+        self._prune(now)
+        if player_id not in self.players:
+            scores = RecentScores(now)
+            for start_time, points in rounds:
+                scores.add(start_time, points, now)
+            self.players[player_id] = scores
+        scores = self.players[player_id]
+        scores.touched = now
+        return scores.get(now)
+
+    def add(self, player_id, start_time, points):
+        """
+        Count a scored round, returns the new scores or None if the player
+        isn't tracked.
+
+        """
+        scores = self.players.get(player_id)
+        if scores is None:
+            return None
+        now = datetime.utcnow()
+        scores.add(start_time, points, now)
+        return scores.get(now)
+
+    def get(self, player_id):
+        scores = self.players.get(player_id)
+        if scores is None:
+            return None
+        return scores.get(datetime.utcnow())
+
+
+scoreboard = ScoreBoard()
@@ -0,0 +1,55 @@
+import itertools
+import time
+from collections import deque
+
+from trivia.fanout import Prepared
+
+# Sequence numbers are unique across rooms and restarts, so a client's
+# last seen number only ever matches the scrollback it came from.
+_seq = itertools.count(int(time.time() * 1000))
+
+
+class Scrollback(object):
+    """
+    The last chat lines of a room, in a fixed-size ring buffer.
+
+    The full replay sent to joining players is encoded once and reused
+    until the next line is added.
+
+    """
+
+    def __init__(self, size):
+        self.entries = deque(maxlen=size)
+        self.replay = Prepared([])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    @staticmethod
+    def next_seq():
+        return next(_seq)
+
+    def append(self, entry):
+        self.entries.append(entry)
+        self.replay = None
+
+    def since(self, seq=None):
+        """
+        Get the lines after seq, or the full replay if seq is unknown here.
+
+        """
+        newer = []
+        if seq is not None:
+            for entry in reversed(self.entries):
+                if entry["seq"] == seq:
+                    newer.reverse()
+                    return newer
+                if entry["seq"] < seq:
+                    break
+                newer.append(entry)
+        if self.replay is None:
+            self.replay = Prepared(list(self.entries))
+        return self.replay
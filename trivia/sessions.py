@@ -0,0 +1,73 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+
+class ResumeTokens(object):
+    """
+    Signed, short-lived tokens that let a reconnecting client skip login.
+
+    A token carries everything needed to restore the player entry, so
+    resuming needs neither a password check nor a database read. Set
+    ``RESUME_SECRET`` to keep tokens valid across restarts.
+
+    Tokens also carry the player's generation, bumped by ``revoke`` on a
+    rename or password change, so older tokens stop working. Generations
+    live in memory only, after a restart revoked tokens are accepted
+    again until they expire.
+
+    """
+
+    SECRET = os.environ.get("RESUME_SECRET")
+    TTL = int(os.environ.get("RESUME_TTL", 15 * 60))
+
+    def __init__(self, secret=None, ttl=None):
+        secret = secret or self.SECRET
+        self.secret = secret.encode() if secret else os.urandom(32)
+        self.ttl = ttl or self.TTL
+        self.generations = {}
+
+    def _sign(self, payload):
+        return hmac.new(self.secret, payload, hashlib.sha256).hexdigest()
+
+    def issue(self, player):
+        data = {
+            "id": player["id"],
+            "name": player["name"],
+            "permissions": player["permissions"],
+            "gen": self.generations.get(player["id"], 0),
+            "exp": int(time.time()) + self.ttl,
+        }
+        payload = base64.urlsafe_b64encode(json.dumps(data).encode())
+        return "{}.{}".format(payload.decode(), self._sign(payload))
+
+    def verify(self, token):
+        """
+        Returns the player stored in a valid token, None otherwise.
+
+        """
+        try:
+            payload, signature = str(token).encode().split(b".", 1)
+        except ValueError:
+            return None
+        if not hmac.compare_digest(self._sign(payload).encode(), signature):
+            return None
+        data = json.loads(base64.urlsafe_b64decode(payload))
+        if data.pop("exp") < time.time():
+            return None
+        if data.pop("gen", 0) != self.generations.get(data["id"], 0):
+            return None
+        return data
+
+    def revoke(self, player_id):
+        """
+        Invalidate all tokens issued for a player so far.
+
+        """
+        self.generations[player_id] = self.generations.get(player_id, 0) + 1
+
+
+resume_tokens = ResumeTokens()
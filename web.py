@@ -7,18 +7,20 @@ import os
 from flask import (
     Flask,
     abort,
+    make_response,
     redirect,
     render_template,
     request,
     send_from_directory,
     url_for,
 )
-from pony.orm import count, db_session, left_join
+from pony.orm import db_session
 from random_username.generate import generate_username
 from raven.contrib.flask import Sentry
 
 from trivia.helpers import format_number, get_week_tuple, timesince
-from trivia.models import Player, db
+from trivia.models import Player, PlayerDailyScore, Round, db
+from trivia.pagecache import PageCache
 
 app = Flask(__name__)
 app.jinja_env.filters["timesince"] = timesince
@@ -32,6 +34,13 @@ WS_ADDR = os.environ.get("WS_ADDR", "ws://localhost:8080")
 
 EARLIEST_DATE = datetime.date(2017, 5, 22)
 
+# Rendered highscores, periods still open are kept for HIGHSCORES_TTL seconds
+# or until the next round is scored.
+page_cache = PageCache("pages", int(os.environ.get("PAGE_CACHE_SIZE", 1000)))
+HIGHSCORES_TTL = int(os.environ.get("HIGHSCORES_TTL", 60))
+# Rounds are written behind the game, a period is final a bit after its end.
+HIGHSCORES_FINAL_AFTER = datetime.timedelta(minutes=5)
+
 
 @app.route("/")
 def index():
@@ -46,13 +55,28 @@ def stats_search(error=None, name=None):
         name = ""
     else:
         with db_session():
-            suggestions = Player.select(lambda p: name.lower() in p.name.lower())[:6]
+            suggestions = Player.search(name)
 
     return render_template(
         "stats/search.html", error=error, name=name, suggestions=suggestions
     )
 
 
+@app.route("/stats/search/autocomplete")
+@db_session
+def stats_autocomplete():
+    """
+    Player names starting with ``q``, for the search form as the user types.
+
+    """
+    prefix = request.args.get("q", "")[: Player.NAME_MAX_LEN]
+    names = Player.complete(prefix) if prefix else []
+    response = make_response({"names": list(names)})
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response
+
+
 @app.route("/stats/user/", methods=["GET", "POST"])
 @db_session
 def stats_user():
@@ -176,16 +200,15 @@ def highscores(year=None, month=None, day=None, week=None):
     mode = "all_time"
     title = "All Time"
     subtitle = None
-    dt, f = None, None
+    dt, dt_end = None, None
 
-    today = datetime.datetime.utcnow().date()
-    r = today  # dummy for filter lambdas
+    now = datetime.datetime.utcnow()
+    today = now.date()
 
     # daily highscores
     if year and month and day:
         mode = "day"
-        dt = datetime.date(year, month, day)
-        f = lambda: r.start_time.date() == dt
+        dt = dt_end = datetime.date(year, month, day)
         title = dt.strftime("%B %d, %Y")
 
     # weekly highscores
@@ -194,7 +217,7 @@ def highscores(year=None, month=None, day=None, week=None):
         dt, dt_week_end = get_week_tuple(
             datetime.date(year, 1, 1) + datetime.timedelta(weeks=week - 1)
         )
-        f = lambda: r.start_time.date() >= dt and r.start_time.date() <= dt_week_end
+        dt_end = dt_week_end
         title = "Week {}, {}".format(dt.isocalendar()[1], dt.isocalendar()[0])
 
         end_fmt = " - %B %d" if dt.month != dt_week_end.month else "-%d"
@@ -204,27 +227,20 @@ def highscores(year=None, month=None, day=None, week=None):
     elif year and month:
         mode = "month"
         dt = datetime.date(year, month, 1)
-        f = lambda: r.start_time.year == dt.year and r.start_time.month == dt.month
+        dt_end = dt.replace(day=calendar.monthrange(year, month)[1])
         title = dt.strftime("%B %Y")
 
     # yearly highscores
     elif year:
         mode = "year"
         dt = datetime.date(year, 1, 1)
-        f = lambda: r.start_time.year == dt.year
+        dt_end = datetime.date(year, 12, 31)
         title = dt.strftime("%Y")
 
     if dt is not None and today < dt:
         # Can't see into the future :(
         abort(400, "Cannot see into the future: {}".format(dt))
 
-    highscores = left_join(
-        (p, sum(r.points), count(r)) for p in Player for r in p.rounds_solved
-    ).order_by(-2)
-
-    if f is not None:
-        highscores = highscores.filter(f)
-
     if mode == "day":
         if dt == today:
             title = "Today's"
@@ -237,21 +253,65 @@ def highscores(year=None, month=None, day=None, week=None):
             url_for("stats_user"), request.args.get("player")
         )
 
-    prevlink, nextlink = _highscore_nav_links(mode, dt)
-
-    return render_template(
-        "stats/highscores.html",
-        backlink=backlink,
-        prevlink=prevlink,
-        nextlink=nextlink,
-        title=title,
-        subtitle=subtitle,
-        mode=mode,
-        dt=dt,
-        today=today,
-        highscores=highscores[:10],
+    final = dt_end is not None and dt_end < (now - HIGHSCORES_FINAL_AFTER).date()
+    # The page links to the current periods, so even final ones change daily.
+    key = "highscores:{}:{}:{}:{}:{}".format(
+        mode,
+        dt,
+        today,
+        "final" if final else Round.last_solved_id(),
+        request.args.get("player", ""),
     )
 
+    body = page_cache.get(key)
+    if body is None:
+        prevlink, nextlink = _highscore_nav_links(mode, dt)
+        body = render_template(
+            "stats/highscores.html",
+            backlink=backlink,
+            prevlink=prevlink,
+            nextlink=nextlink,
+            title=title,
+            subtitle=subtitle,
+            mode=mode,
+            dt=dt,
+            today=today,
+            highscores=PlayerDailyScore.highscores(dt, dt_end),
+        ).encode()
+        page_cache.set(key, body, 0 if final else HIGHSCORES_TTL)
+
+    response = make_response(body)
+    response.add_etag()
+    if final:
+        midnight = datetime.datetime.combine(
+            today + datetime.timedelta(days=1), datetime.time()
+        )
+        response.cache_control.public = True
+        response.cache_control.max_age = int((midnight - now).total_seconds())
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.cli.command("backfill-scores")
+@db_session
+def backfill_scores():
+    """
+    Rebuild the daily score rollups from all rounds.
+
+    """
+    PlayerDailyScore.backfill()
+
+
+@app.cli.command("create-search-indexes")
+@db_session
+def create_search_indexes():
+    """
+    Create the indexes for player name search, needs the pg_trgm extension.
+
+    """
+    Player.create_search_indexes()
+
 
 @app.route("/randomnick", methods=["POST"])
 def random_nickname():